@@ -0,0 +1,69 @@
+"""Times rendering RiskAssessments through fhirclient against RiskAssessmentTemplate.render
+
+The fhirclient path builds and serializes one RiskAssessment per patient with as_json, like the FHIR write back did before
+the template. Run from src: python -m benchmarks.riskAssessmentRender [patients] [repeat]
+"""
+
+import copy
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fhirclient.models.riskassessment as fhir_ra
+import rdb.fhir_models.riskAssessment as fhir_ra_base
+from util.riskAssessmentTemplate import RiskAssessmentTemplate
+
+MODEL_ID = 1
+CONDITION_REFERENCE = 'Measurement/700000008'
+OUTCOME_CODES = {'yes': 'chem_therapy_resp_yes', 'no': 'chem_therapy_resp_no'}
+
+
+def get_predictions(patients):
+    return [{'patientId': str(i), 'prediction': 'yes' if i % 3 else 'no', 'probability': (i % 100) / 100.0} for i in range(patients)]
+
+
+def render_with_fhirclient(predictions):
+    resources = []
+
+    for prediction in predictions:
+        resource = copy.deepcopy(fhir_ra_base.fhir__base_risk_assessment)
+        resource['subject'] = {'reference': 'Patient/' + prediction['patientId']}
+        resource['condition'] = {'reference': CONDITION_REFERENCE}
+        patient_prediction = copy.deepcopy(fhir_ra_base.fhir_base_patient_prediction)
+        patient_prediction['outcome']['coding'][0]['code'] = OUTCOME_CODES[prediction['prediction']]
+        patient_prediction['probabilityDecimal'] = prediction['probability']
+        resource['prediction'] = [patient_prediction]
+        resources.append(fhir_ra.RiskAssessment(resource).as_json())
+
+    return resources
+
+
+def render_with_template(predictions):
+    template = RiskAssessmentTemplate(MODEL_ID, CONDITION_REFERENCE, OUTCOME_CODES)
+
+    return [template.render(p['patientId'], p['prediction'], p['probability']) for p in predictions]
+
+
+def main():
+    patients = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    predictions = get_predictions(patients)
+
+    # both paths have to produce the same outcome codes for the benchmark to be meaningful
+    codes = [[r['prediction'][0]['outcome']['coding'][0]['code'] for r in fn(predictions[:100])]
+             for fn in (render_with_fhirclient, render_with_template)]
+    assert codes[0] == codes[1]
+
+    results = {}
+    for name, fn in (('fhirclient', render_with_fhirclient), ('template', render_with_template)):
+        best = min(timeit.repeat(lambda: fn(predictions), number=1, repeat=repeat))
+        results[name] = best
+        print("{:<10} {:>8.3f} s for {} patients, {:>10.0f} resources/s".format(name, best, patients, patients / best))
+
+    print("speedup    {:>8.1f}x".format(results['fhirclient'] / results['template']))
+
+
+if __name__ == '__main__':
+    main()
@@ -31,3 +31,115 @@ KETOS_HOST = str(os.getenv('KETOS_HOST', ''))
 KETOS_DATA_FOLDER = str(os.getenv('KETOS_DATA_FOLDER', '/ketos'))
 
 
+
+CREDENTIAL_CACHE_SIZE = int(os.getenv('CREDENTIAL_CACHE_SIZE', 1024))
+CREDENTIAL_CACHE_TTL = int(os.getenv('CREDENTIAL_CACHE_TTL', 300))
+
+# comma separated list of token signing keys, the last key signs new tokens - older keys are only used for verification
+AUTH_TOKEN_SECRET_KEYS = str(os.getenv('AUTH_TOKEN_SECRET_KEYS', ''))
+AUTH_TOKEN_TTL = int(os.getenv('AUTH_TOKEN_TTL', 900))
+AUTH_TOKEN_REVOCATION_REFRESH = int(os.getenv('AUTH_TOKEN_REVOCATION_REFRESH', 5))
+
+PREDICTION_JOB_WORKERS = int(os.getenv('PREDICTION_JOB_WORKERS', 2))
+
+# cohorts larger than the chunk size are crawled and scored chunk by chunk, 0 disables chunking
+PREDICTION_CHUNK_SIZE = int(os.getenv('PREDICTION_CHUNK_SIZE', 1000))
+PREDICTION_CRAWL_WORKERS = int(os.getenv('PREDICTION_CRAWL_WORKERS', 4))
+PREDICTION_SCORE_WORKERS = int(os.getenv('PREDICTION_SCORE_WORKERS', 2))
+
+# crawled feature rows are reused for this many seconds, a size of 0 disables the feature cache
+FEATURE_CACHE_SIZE = int(os.getenv('FEATURE_CACHE_SIZE', 100000))
+FEATURE_CACHE_FRESHNESS = int(os.getenv('FEATURE_CACHE_FRESHNESS', 3600))
+# seconds the background download of crawled rows for the feature cache may take
+FEATURE_CACHE_DOWNLOAD_TIMEOUT = float(os.getenv('FEATURE_CACHE_DOWNLOAD_TIMEOUT', 60))
+CRAWLER_CSV_PATIENT_COLUMN = str(os.getenv('CRAWLER_CSV_PATIENT_COLUMN', 'patient_id'))
+
+# address of this api as seen from the environment containers
+KETOS_BRAIN_API_URL = str(os.getenv('KETOS_BRAIN_API_URL', 'http://ml_service:5000'))
+# prediction input urls handed to the environment containers are signed and expire after this many seconds
+PREDICTION_INPUT_URL_TTL = int(os.getenv('PREDICTION_INPUT_URL_TTL', 900))
+
+CRAWLER_PAYLOAD_CACHE_SIZE = int(os.getenv('CRAWLER_PAYLOAD_CACHE_SIZE', 256))
+CRAWLER_PAYLOAD_CACHE_TTL = int(os.getenv('CRAWLER_PAYLOAD_CACHE_TTL', 60))
+
+CONTAINER_POOL_SIZE = int(os.getenv('CONTAINER_POOL_SIZE', 8))
+CONTAINER_CONNECT_TIMEOUT = float(os.getenv('CONTAINER_CONNECT_TIMEOUT', 3))
+CONTAINER_READ_TIMEOUT = float(os.getenv('CONTAINER_READ_TIMEOUT', 600))
+CONTAINER_RETRIES = int(os.getenv('CONTAINER_RETRIES', 2))
+CONTAINER_RETRY_BACKOFF = float(os.getenv('CONTAINER_RETRY_BACKOFF', 0.5))
+
+# identical predictions arriving within this many seconds are answered from memory, 0 only coalesces concurrent requests
+PREDICTION_MEMO_TTL = int(os.getenv('PREDICTION_MEMO_TTL', 30))
+PREDICTION_MEMO_SIZE = int(os.getenv('PREDICTION_MEMO_SIZE', 64))
+
+OMOP_CURSOR_ITERSIZE = int(os.getenv('OMOP_CURSOR_ITERSIZE', 2000))
+
+# schema of the omop cdm tables, whose newest entries decide which patients of a scheduled cohort are rescored
+OMOP_CDM_SCHEMA = str(os.getenv('OMOP_CDM_SCHEMA', 'omopv5'))
+# seconds between checks for due prediction schedules, 0 disables the scheduler
+PREDICTION_SCHEDULER_INTERVAL = int(os.getenv('PREDICTION_SCHEDULER_INTERVAL', 60))
+
+# seconds a synchronous prediction request may take unless the client sends an X-Request-Deadline header, 0 disables it
+PREDICTION_DEADLINE = int(os.getenv('PREDICTION_DEADLINE', 300))
+# an environment container is cut off for CIRCUIT_OPEN_SECONDS after this many consecutive failed or slow calls
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv('CIRCUIT_SLOW_CALL_SECONDS', 120))
+CIRCUIT_OPEN_SECONDS = float(os.getenv('CIRCUIT_OPEN_SECONDS', 30))
+
+ENVIRONMENT_MAX_REPLICAS = int(os.getenv('ENVIRONMENT_MAX_REPLICAS', 8))
+
+# hand the model input to the environment containers as a file in their data directory instead of a download url,
+# requires environment images whose execute endpoint accepts the dataPath parameter
+PREDICTION_DATA_HANDOFF = os.getenv('PREDICTION_DATA_HANDOFF', 'false').lower() == 'true'
+
+# crawler jobs of predictions are deleted in batches by a background thread, failed deletions are retried with a growing delay
+CRAWLER_CLEANUP_BATCH_SIZE = int(os.getenv('CRAWLER_CLEANUP_BATCH_SIZE', 50))
+CRAWLER_CLEANUP_TIMEOUT = float(os.getenv('CRAWLER_CLEANUP_TIMEOUT', 10))
+CRAWLER_CLEANUP_RETRY_DELAY = int(os.getenv('CRAWLER_CLEANUP_RETRY_DELAY', 30))
+CRAWLER_CLEANUP_MAX_ATTEMPTS = int(os.getenv('CRAWLER_CLEANUP_MAX_ATTEMPTS', 10))
+CRAWLER_CLEANUP_SWEEP_INTERVAL = int(os.getenv('CRAWLER_CLEANUP_SWEEP_INTERVAL', 300))
+CRAWLER_CLEANUP_SWEEP_LIMIT = int(os.getenv('CRAWLER_CLEANUP_SWEEP_LIMIT', 500))
+# jobs older than this many seconds were left behind by a crashed request and are swept up
+CRAWLER_JOB_MAX_AGE = int(os.getenv('CRAWLER_JOB_MAX_AGE', 3600))
+
+# expensive requests (predictions, crawls, model export/import, environment creation) running at once per worker process,
+# the remaining uwsgi threads stay free for interactive requests
+ADMISSION_CAPACITY = int(os.getenv('ADMISSION_CAPACITY', 3))
+ADMISSION_USER_BUDGET = int(os.getenv('ADMISSION_USER_BUDGET', 2))
+# requests over budget wait in a per-user queue for at most ADMISSION_MAX_WAIT seconds before they get a 429
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', 2))
+ADMISSION_MAX_WAIT = float(os.getenv('ADMISSION_MAX_WAIT', 10))
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 10))
+
+# every prediction is kept in the prediction_result table, rows are inserted this many at a time
+PREDICTION_RESULT_STORE = os.getenv('PREDICTION_RESULT_STORE', 'true').lower() == 'true'
+PREDICTION_RESULT_BATCH_SIZE = int(os.getenv('PREDICTION_RESULT_BATCH_SIZE', 1000))
+PREDICTION_RESULT_PAGE_LIMIT = int(os.getenv('PREDICTION_RESULT_PAGE_LIMIT', 1000))
+
+# risk assessments are written to FHIR in transaction bundles of this size, FHIR_WRITE_WORKERS bundles at a time
+FHIR_BUNDLE_SIZE = int(os.getenv('FHIR_BUNDLE_SIZE', 100))
+FHIR_WRITE_WORKERS = int(os.getenv('FHIR_WRITE_WORKERS', 4))
+FHIR_WRITE_TIMEOUT = float(os.getenv('FHIR_WRITE_TIMEOUT', 120))
+
+# with the outbox, risk assessments are queued in the rdb and written to FHIR by a background thread of every worker
+FHIR_OUTBOX = os.getenv('FHIR_OUTBOX', 'true').lower() == 'true'
+FHIR_OUTBOX_BATCH_SIZE = int(os.getenv('FHIR_OUTBOX_BATCH_SIZE', 500))
+FHIR_OUTBOX_POLL_INTERVAL = float(os.getenv('FHIR_OUTBOX_POLL_INTERVAL', 2))
+FHIR_OUTBOX_MAX_ATTEMPTS = int(os.getenv('FHIR_OUTBOX_MAX_ATTEMPTS', 12))
+FHIR_OUTBOX_RETRY_DELAY = int(os.getenv('FHIR_OUTBOX_RETRY_DELAY', 5))
+FHIR_OUTBOX_MAX_RETRY_DELAY = int(os.getenv('FHIR_OUTBOX_MAX_RETRY_DELAY', 3600))
+# claimed entries are not handed to another worker for this many seconds, longer than writing a batch may take
+FHIR_OUTBOX_LEASE = int(os.getenv('FHIR_OUTBOX_LEASE', 900))
+
+OUTCOME_CACHE_SIZE = int(os.getenv('OUTCOME_CACHE_SIZE', 1024))
+OUTCOME_CACHE_TTL = int(os.getenv('OUTCOME_CACHE_TTL', 300))
+TEMPLATE_CACHE_SIZE = int(os.getenv('TEMPLATE_CACHE_SIZE', 256))
+TEMPLATE_CACHE_TTL = int(os.getenv('TEMPLATE_CACHE_TTL', 3600))
+
+# only risk assessments which differ from the last one written for the patient and model are written to FHIR again
+FHIR_WRITE_CHANGED_ONLY = os.getenv('FHIR_WRITE_CHANGED_ONLY', 'true').lower() == 'true'
+
+# bulk exports of stored predictions are written as NDJSON files of at most PREDICTION_EXPORT_FILE_SIZE resources
+PREDICTION_EXPORT_WORKERS = int(os.getenv('PREDICTION_EXPORT_WORKERS', 1))
+PREDICTION_EXPORT_FILE_SIZE = int(os.getenv('PREDICTION_EXPORT_FILE_SIZE', 10000))
+PREDICTION_EXPORT_PAGE_SIZE = int(os.getenv('PREDICTION_EXPORT_PAGE_SIZE', 1000))
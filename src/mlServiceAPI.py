@@ -2,10 +2,11 @@ from flask import Flask
 from flask_restful_swagger_2 import Api
 from resources.userResource import UserListResource, UserResource, UserLoginResource
 from resources.imageResource import ImageListResource, ImageResource
-from resources.environmentResource import EnvironmentListResource, EnvironmentResource, UserEnvironmentListResource
+from resources.environmentResource import EnvironmentListResource, EnvironmentResource, UserEnvironmentListResource, EnvironmentMetricsResource, EnvironmentReplicaListResource
 from resources.featureResource import FeatureListResource, FeatureResource, UserFeatureListResource
 from resources.featureSetResource import FeatureSetListResource, FeatureSetResource, UserFeatureSetListResource, FeatureSetFeatureListResource
-from resources.mlModelResource import MLModelListResource, MLModelResource, UserMLModelListResource, MLModelPredicitionResource
+from resources.mlModelResource import MLModelListResource, MLModelResource, UserMLModelListResource, MLModelPredicitionResource, MLModelPredictionJobResource, MLModelMultiPredictionResource, MLModelCohortPredictionResource, MLModelPredictionResultResource
+from resources.mlModelResource import MLModelPredictionExportListResource, MLModelPredictionExportResource, MLModelPredictionExportFileResource
 from resources.mlModelResource import MLModelExportResource, MLModelImportResource, MLModelImportSuitableEnvironmentResource, MLModelImportSuitableFeatureSetResource
 from resources.dataResource import DataListResource, DataResource
 from resources.resourceConfigResource import ResourceConfig
@@ -13,7 +14,13 @@ from resources.annotationResource import AnnotationTaskListResource, AnnotationT
 from resources.annotationResource import AnnotationTaskScaleEntryListResource, AnnotationTaskAnnotatorListResource, AnnotationResultListResource, AnnotatorResultListResource, EntriesForAnnotatorResource, AnnotationTaskScaleEntry
 from resources.predictionOutcomeResource import ModelPredictionOutcomeListResource, PredictionOutcomeListResource, PredictionOutcomeResource
 from resources.atlasCohortResource import AtlasCohortResource
-from rdb.rdb import connect_to_db, create_all, create_admin_user, create_default_images, create_default_features
+from resources.predictionInputResource import PredictionInputResource
+from resources.fhirOutboxResource import FhirOutboxResource
+from resources.predictionScheduleResource import PredictionScheduleListResource, PredictionScheduleResource, PredictionScheduleRunListResource, PredictionSchedulePredictionListResource
+from rdb.rdb import connect_to_db, create_all, create_admin_user, create_default_images, create_default_features, delete_expired_auth_token_revocations, fail_interrupted_prediction_jobs
+from util import predictionScheduler as PredictionScheduler
+from util import crawlerCleanup as CrawlerCleanup
+from util import fhirOutboxUtil as FhirOutboxUtil
 from flask_cors import CORS
 import json
 import logging
@@ -27,13 +34,18 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 api = Api(app,
           add_api_spec_resource=True, api_version='0.0', api_spec_url='/api/swagger', schemes=["http"], #, "https", {"securitySchemes": {"basicAuth": {"type": "http"}}}],
-          security=[{"basicAuth": []}], security_definitions={"basicAuth": {"type": "basic"}})  # Wrap the Api and add /api/swagger endpoint
+          security=[{"basicAuth": []}, {"bearerAuth": []}], security_definitions={"basicAuth": {"type": "basic"}, "bearerAuth": {"type": "apiKey", "name": "Authorization", "in": "header"}})  # Wrap the Api and add /api/swagger endpoint
 
 connect_to_db(app)
 create_all()
 create_admin_user()
 create_default_images()
 create_default_features()
+delete_expired_auth_token_revocations()
+fail_interrupted_prediction_jobs()
+PredictionScheduler.init(app)
+CrawlerCleanup.init()
+FhirOutboxUtil.init()
 
 api.add_resource(UserListResource, '/users', endpoint='users')
 api.add_resource(UserLoginResource, '/users/login', endpoint='user_login')
@@ -44,6 +56,8 @@ api.add_resource(UserFeatureListResource, '/users/<int:user_id>/features', endpo
 api.add_resource(UserFeatureSetListResource, '/users/<int:user_id>/featuresets', endpoint='feature_sets_for_user')
 api.add_resource(EnvironmentListResource, '/environments', endpoint='environments')
 api.add_resource(EnvironmentResource, '/environments/<int:env_id>', endpoint='environment')
+api.add_resource(EnvironmentMetricsResource, '/environments/metrics', endpoint='environment_metrics')
+api.add_resource(EnvironmentReplicaListResource, '/environments/<int:env_id>/replicas', endpoint='environment_replicas')
 api.add_resource(MLModelListResource, '/models', endpoint='models')
 api.add_resource(MLModelResource, '/models/<int:model_id>', endpoint='model')
 api.add_resource(MLModelExportResource, '/models/<int:model_id>/export', endpoint='model_export')
@@ -51,6 +65,13 @@ api.add_resource(MLModelImportResource, '/models/import', endpoint='model_import
 api.add_resource(MLModelImportSuitableEnvironmentResource, '/models/import/suitable-environments', endpoint='model_import_suitable_environments')
 api.add_resource(MLModelImportSuitableFeatureSetResource, '/models/import/suitable-feature-sets', endpoint='model_import_suitable_feature_sets')
 api.add_resource(MLModelPredicitionResource, '/models/<int:model_id>/prediction', endpoint='model_prediction')
+api.add_resource(MLModelMultiPredictionResource, '/models/prediction', endpoint='models_prediction')
+api.add_resource(MLModelCohortPredictionResource, '/models/<int:model_id>/prediction/cohorts/<int:cohort_id>', endpoint='model_cohort_prediction')
+api.add_resource(MLModelPredictionResultResource, '/models/<int:model_id>/prediction/results', endpoint='model_prediction_results')
+api.add_resource(MLModelPredictionJobResource, '/models/<int:model_id>/prediction/jobs/<string:job_id>', endpoint='model_prediction_job')
+api.add_resource(MLModelPredictionExportListResource, '/models/<int:model_id>/prediction/$export', endpoint='model_prediction_exports')
+api.add_resource(MLModelPredictionExportResource, '/models/<int:model_id>/prediction/exports/<string:export_id>', endpoint='model_prediction_export')
+api.add_resource(MLModelPredictionExportFileResource, '/models/<int:model_id>/prediction/exports/<string:export_id>/files/<int:file_number>', endpoint='model_prediction_export_file')
 api.add_resource(ImageListResource, '/images', endpoint='images')
 api.add_resource(ImageResource, '/images/<int:image_id>', endpoint='image')
 api.add_resource(DataListResource, '/data', endpoint='datalist')
@@ -75,6 +96,12 @@ api.add_resource(AnnotatorResource, '/annotators/<string:token>', endpoint='anno
 api.add_resource(AnnotationTaskScaleEntry, '/annotation_tasks/<int:task_id>/scale_entries/<int:scale_entry_id>', endpoint='scale_entry')
 api.add_resource(AtlasCohortResource, '/atlas/cohorts/<int:cohort_id>/patients', endpoint='patients_for_atlas_cohort')
 
+api.add_resource(FhirOutboxResource, '/fhir/outbox', endpoint='fhir_outbox')
+api.add_resource(PredictionInputResource, '/prediction/inputs/<string:input_id>', endpoint='prediction_input')
+api.add_resource(PredictionScheduleListResource, '/prediction_schedules', endpoint='prediction_schedules')
+api.add_resource(PredictionScheduleResource, '/prediction_schedules/<int:schedule_id>', endpoint='prediction_schedule')
+api.add_resource(PredictionScheduleRunListResource, '/prediction_schedules/<int:schedule_id>/runs', endpoint='prediction_schedule_runs')
+api.add_resource(PredictionSchedulePredictionListResource, '/prediction_schedules/<int:schedule_id>/predictions', endpoint='prediction_schedule_predictions')
 api.add_resource(ModelPredictionOutcomeListResource, '/models/<int:model_id>/outcomes', endpoint='prediction_outcomes')
 api.add_resource(PredictionOutcomeListResource, '/models/prediction/outcomes', endpoint='model_prediction_outcome')
 api.add_resource(PredictionOutcomeResource, '/models/outcomes/<int:pred_outcome_id>', endpoint='prediction_outcome')
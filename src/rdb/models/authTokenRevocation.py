@@ -0,0 +1,119 @@
+from rdb.rdb import db
+import datetime
+import threading
+import time
+import config
+
+
+class AuthTokenRevocation(db.Model):
+    """Auth Token Revocation Class"""
+
+    __tablename__ = "auth_token_revocation"
+
+    id = db.Column(db.Integer, autoincrement=True, primary_key=True)
+    # either a single token (jti) or all tokens of a user issued before revoked_at are revoked
+    jti = db.Column(db.Text, nullable=True, index=True)
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+    revoked_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+
+    def __init__(self):
+        super(AuthTokenRevocation, self).__init__()
+
+    def __repr__(self):
+        """Display when printing a auth token revocation object"""
+
+        return "<ID: {}, jti: {}, user id: {}, revoked at: {}>".format(self.id, self.jti, self.user_id, self.revoked_at)
+
+    def as_dict(self):
+        """Convert object to dictionary"""
+
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+class RevocationSnapshot(object):
+    """Process local copy of all active revocations, refreshed from the rdb every few seconds"""
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self.revoked_jtis = set()
+        self.revoked_users = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def is_stale(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.refresh_interval
+
+    def refresh(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        revocations = AuthTokenRevocation.query.filter(AuthTokenRevocation.expires_at > now).all()
+
+        revoked_jtis = set()
+        revoked_users = {}
+        for r in revocations:
+            if r.jti:
+                revoked_jtis.add(r.jti)
+            if r.user_id is not None:
+                revoked_users[r.user_id] = max(revoked_users.get(r.user_id, 0), r.revoked_at.timestamp())
+
+        with self.lock:
+            self.revoked_jtis = revoked_jtis
+            self.revoked_users = revoked_users
+            self.loaded_at = time.monotonic()
+
+    def add(self, jti=None, user_id=None, revoked_at=None):
+        with self.lock:
+            if jti:
+                self.revoked_jtis.add(jti)
+            if user_id is not None:
+                self.revoked_users[user_id] = max(self.revoked_users.get(user_id, 0), revoked_at)
+
+    def contains(self, payload):
+        if payload['jti'] in self.revoked_jtis:
+            return True
+
+        return payload['iat'] <= self.revoked_users.get(payload['id'], 0)
+
+
+snapshot = RevocationSnapshot(config.AUTH_TOKEN_REVOCATION_REFRESH)
+
+
+def is_revoked(payload):
+    if snapshot.is_stale():
+        snapshot.refresh()
+
+    return snapshot.contains(payload)
+
+
+def create(jti=None, user_id=None, expires_at=None):
+    now = time.time()
+    if expires_at is None:
+        # after one token lifetime every token issued before now has expired anyway
+        expires_at = now + config.AUTH_TOKEN_TTL
+
+    r = AuthTokenRevocation()
+    r.jti = jti
+    r.user_id = user_id
+    r.revoked_at = datetime.datetime.fromtimestamp(now, datetime.timezone.utc)
+    r.expires_at = datetime.datetime.fromtimestamp(expires_at, datetime.timezone.utc)
+
+    db.session.add(r)
+    db.session.commit()
+
+    snapshot.add(jti=jti, user_id=user_id, revoked_at=now)
+
+    return r
+
+
+def revoke_token(payload):
+    return create(jti=payload['jti'], expires_at=payload['exp'])
+
+
+def revoke_all_for_user(user_id):
+    return create(user_id=user_id)
+
+
+def delete_expired():
+    now = datetime.datetime.now(datetime.timezone.utc)
+    AuthTokenRevocation.query.filter(AuthTokenRevocation.expires_at <= now).delete()
+    db.session.commit()
@@ -0,0 +1,68 @@
+from rdb.rdb import db
+import config
+
+
+class CrawlerJobCleanup(db.Model):
+    """Crawler job created for a prediction which has not been deleted from the crawler yet"""
+
+    __tablename__ = "crawler_job_cleanup"
+
+    crawler_id = db.Column(db.Text, primary_key=True)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime(timezone=True), nullable=True, index=True)
+    last_error = db.Column(db.Text, nullable=True)
+
+    def __init__(self):
+        super(CrawlerJobCleanup, self).__init__()
+
+    def __repr__(self):
+        """Display when printing a crawler job cleanup object"""
+
+        return "<crawler id: {}, attempts: {}>".format(self.crawler_id, self.attempts)
+
+
+# these functions are called from worker threads without an app context, so they use the engine instead of the session
+table = CrawlerJobCleanup.__table__
+
+
+def track(crawler_id):
+    with db.engine.begin() as connection:
+        connection.execute(table.insert().values(crawler_id=crawler_id, attempts=0))
+
+
+def remove(crawler_ids):
+    if not crawler_ids:
+        return
+
+    with db.engine.begin() as connection:
+        connection.execute(table.delete().where(table.c.crawler_id.in_(crawler_ids)))
+
+
+def record_failures(crawler_ids, error):
+    """Count the failed attempts, delay the next one and give up after the maximum number of attempts"""
+
+    if not crawler_ids:
+        return 0
+
+    delay = db.func.make_interval(0, 0, 0, 0, 0, 0, (table.c.attempts + 1) * config.CRAWLER_CLEANUP_RETRY_DELAY)
+
+    with db.engine.begin() as connection:
+        connection.execute(table.update().where(table.c.crawler_id.in_(crawler_ids))
+                           .values(attempts=table.c.attempts + 1, next_attempt_at=db.func.now() + delay, last_error=error))
+        result = connection.execute(table.delete().where(table.c.crawler_id.in_(crawler_ids))
+                                    .where(table.c.attempts >= config.CRAWLER_CLEANUP_MAX_ATTEMPTS))
+
+    return result.rowcount
+
+
+def get_due(limit):
+    """Failed deletions due for a retry and jobs left behind by crashed requests"""
+
+    orphaned_before = db.func.now() - db.func.make_interval(0, 0, 0, 0, 0, 0, config.CRAWLER_JOB_MAX_AGE)
+    statement = table.select()\
+        .where(db.or_(table.c.next_attempt_at <= db.func.now(), db.and_(table.c.next_attempt_at.is_(None), table.c.created_at < orphaned_before)))\
+        .order_by(table.c.created_at).limit(limit)
+
+    with db.engine.begin() as connection:
+        return [row.crawler_id for row in connection.execute(statement)]
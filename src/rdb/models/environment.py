@@ -6,7 +6,7 @@ from flask import g
 import rdb.models.image as Image
 from dockerUtil.dockerClient import dockerClient, wait_for_it
 import config
-import requests
+from util import containerClient as ContainerClient
 import uuid
 from flask_restful import abort
 import rdb.models.user as User
@@ -30,6 +30,7 @@ class Environment(db.Model):
     # authorized_users = db.relationship('User', lazy='subquery', secondary='user_environment_access')
     image_id = db.Column(db.Integer, db.ForeignKey('image.id'), nullable=False)
     ml_models = db.relationship('MLModel', lazy='select', cascade='delete, delete-orphan', backref='environment')
+    replicas = db.relationship('EnvironmentReplica', lazy='select', cascade='delete, delete-orphan', backref='environment')
     created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
     updated_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), onupdate=datetime.datetime.now)
 
@@ -56,7 +57,7 @@ class Environment(db.Model):
         # wait for container api to be up and running
         wait_for_it(self.container_name, 5000)
         # start jupyter notebook and get jupyter token
-        resp = requests.post('http://' + self.container_name + ':5000/jupyter').json()
+        resp = ContainerClient.post(self.container_name, '/jupyter').json()
         self.jupyter_token = str(resp['jupyter_token'])
         self.status = Environment.Status.running.value
 
@@ -74,6 +75,11 @@ class Environment(db.Model):
         
         return config.KETOS_DATA_FOLDER + '/environments_data/' + self.container_name
 
+    def get_container_names(self):
+        """Containers serving the models of this environment, the environment's own container first"""
+
+        return (self.container_name,) + tuple(r.container_name for r in self.replicas if r.status == Environment.Status.running.value)
+
     class Status(Enum):
         running = 'running'
         stopped = 'stopped'
@@ -89,6 +95,17 @@ def get_open_port():
     return port
 
 
+def run_container(image_name, container_name, data_directory, ports=None):
+    return dockerClient.containers.run(image_name,
+                                       name=container_name,
+                                       detach=True,
+                                       network=config.PROJECT_NAME+"_environment",
+                                       ports=ports,
+                                       volumes={data_directory: {'bind': '/mlenvironment/models', 'mode': 'rw'},
+                                                config.KETOS_DATA_FOLDER+'/auth': {'bind': '/root/src/auth', 'mode': 'ro'}}
+                                       )
+
+
 def create(name, desc, image_id, raise_abort=True):
     e = Environment()
     e.name = name
@@ -104,14 +121,7 @@ def create(name, desc, image_id, raise_abort=True):
 
     e.container_name = str(uuid.uuid4().hex)
 
-    container = dockerClient.containers.run(image_name,
-                                            name=e.container_name,
-                                            detach=True,
-                                            network=config.PROJECT_NAME+"_environment",
-                                            ports={"8000/tcp": e.jupyter_port},
-                                            volumes={e.get_data_directory(): {'bind': '/mlenvironment/models', 'mode': 'rw'},
-                                                     config.KETOS_DATA_FOLDER+'/auth': {'bind': '/root/src/auth', 'mode': 'ro'}}
-                                            )
+    container = run_container(image_name, e.container_name, e.get_data_directory(), ports={"8000/tcp": e.jupyter_port})
 
     e.container_id = container.id
     e.start_jupyter()
@@ -172,8 +182,14 @@ def update(env_id, status=None, name=None, desc=None, raise_abort=True):
         if status == Environment.Status.running.value:
             dockerClient.containers.get(e.container_id).start()
             e.start_jupyter()
+            for r in e.replicas:
+                dockerClient.containers.get(r.container_id).start()
+                r.status = status
         elif status == Environment.Status.stopped.value:
             dockerClient.containers.get(e.container_id).stop()
+            for r in e.replicas:
+                dockerClient.containers.get(r.container_id).stop()
+                r.status = status
         else:
             if raise_abort:
                 abort(400, message="status {} is not allowed".format(status))
@@ -205,6 +221,11 @@ def delete(env_id, raise_abort=True):
 
     container = dockerClient.containers.get(e.container_id)
     container.remove(force=True)
+    ContainerClient.close_session(e.container_name)
+
+    for r in e.replicas:
+        dockerClient.containers.get(r.container_id).remove(force=True)
+        ContainerClient.close_session(r.container_name)
 
     db.session.delete(e)
     db.session.commit()
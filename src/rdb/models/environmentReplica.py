@@ -0,0 +1,98 @@
+from rdb.rdb import db, LowerCaseText
+import datetime
+import rdb.models.environment as Environment
+from dockerUtil.dockerClient import dockerClient, wait_for_it
+import config
+from util import containerClient as ContainerClient
+import uuid
+from flask_restful import abort
+
+
+class EnvironmentReplica(db.Model):
+    """Additional container of an environment serving the same models"""
+
+    __tablename__ = "environment_replica"
+
+    id = db.Column(db.Integer, autoincrement=True, primary_key=True)
+    environment_id = db.Column(db.Integer, db.ForeignKey('environment.id'), nullable=False, index=True)
+    container_id = db.Column(db.Text, nullable=False)
+    container_name = db.Column(db.Text, nullable=False)
+    status = db.Column(LowerCaseText, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+    updated_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), onupdate=datetime.datetime.now)
+
+    def __init__(self):
+        super(EnvironmentReplica, self).__init__()
+
+    def __repr__(self):
+        """Display when printing a environment replica object"""
+
+        return "<ID: {}, environment id: {}, container name: {}>".format(self.id, self.environment_id, self.container_name)
+
+    def as_dict(self):
+        """Convert object to dictionary"""
+
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+def create(e):
+    r = EnvironmentReplica()
+    r.environment_id = e.id
+    r.container_name = str(uuid.uuid4().hex)
+
+    # same image and data directory as the environment, but without a jupyter port
+    image_name = config.DOCKER_REGISTRY_DOMAIN + "/" + e.base_image.name
+    container = Environment.run_container(image_name, r.container_name, e.get_data_directory())
+    r.container_id = container.id
+
+    wait_for_it(r.container_name, ContainerClient.CONTAINER_API_PORT)
+    r.status = Environment.Environment.Status.running.value
+
+    db.session.add(r)
+    db.session.commit()
+
+    return r
+
+
+def remove(r):
+    dockerClient.containers.get(r.container_id).remove(force=True)
+    ContainerClient.close_session(r.container_name)
+
+    db.session.delete(r)
+    db.session.commit()
+
+
+def get_all_for_environment(env_id):
+    e = Environment.get(env_id)
+
+    return e.replicas
+
+
+def scale(env_id, replicas, raise_abort=True):
+    """Start or remove replica containers until the environment has the given number of replicas"""
+
+    e = Environment.get(env_id, raise_abort=raise_abort)
+
+    if replicas < 0 or replicas > config.ENVIRONMENT_MAX_REPLICAS:
+        if raise_abort:
+            abort(400, message="number of replicas must be between 0 and {}".format(config.ENVIRONMENT_MAX_REPLICAS))
+        else:
+            return None
+
+    if replicas > len(e.replicas) and not e.status == Environment.Environment.Status.running.value:
+        if raise_abort:
+            abort(405, message="environment must be running to add replicas")
+        else:
+            return None
+
+    while len(e.replicas) < replicas:
+        create(e)
+        db.session.refresh(e)
+
+    # the newest replicas are removed first
+    for r in sorted(e.replicas, key=lambda cur: cur.id)[replicas:]:
+        remove(r)
+
+    db.session.refresh(e)
+
+    return e.replicas
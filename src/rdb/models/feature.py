@@ -3,6 +3,7 @@ import datetime
 from flask import g
 from flask_restful import abort
 import rdb.models.user as User
+from util import featureCache as FeatureCache
 
 
 class Feature(db.Model):
@@ -107,6 +108,9 @@ def update(feature_id, resource=None, parameter_name=None, value=None, name=None
         f.output_value_path = None
 
     db.session.commit()
+
+    for fs in f.feature_sets:
+        FeatureCache.invalidate_feature_set(fs.id)
     return f
 
 
@@ -115,7 +119,12 @@ def delete(feature_id, raise_abort=True):
 
     User.check_request_for_logged_in_user(f.creator_id)
 
+    feature_set_ids = [fs.id for fs in f.feature_sets]
+
     db.session.delete(f)
     db.session.commit()
 
+    for feature_set_id in feature_set_ids:
+        FeatureCache.invalidate_feature_set(feature_set_id)
+
     return feature_id
@@ -4,6 +4,7 @@ from flask import g
 from flask_restful import abort
 import rdb.models.feature as Feature
 import rdb.models.user as User
+from util import featureCache as FeatureCache
 
 
 class FeatureSet(db.Model):
@@ -78,6 +79,7 @@ def remove_features(feature_set_id, feature_ids, raise_abort=True):
             fs.features.remove(f)
 
     db.session.commit()
+    FeatureCache.invalidate_feature_set(fs.id)
 
     return fs
 
@@ -90,6 +92,7 @@ def add_features(feature_set_id, feature_ids, raise_abort=True):
             fs.features.append(f)
 
     db.session.commit()
+    FeatureCache.invalidate_feature_set(fs.id)
     return fs
 
 
@@ -115,6 +118,7 @@ def delete(feature_set_id, raise_abort=True):
 
     fs.features = []
     db.session.commit()
+    FeatureCache.invalidate_feature_set(fs.id)
 
     db.session.delete(fs)
     db.session.commit()
@@ -0,0 +1,108 @@
+from rdb.rdb import db
+import config
+
+
+class FhirOutbox(db.Model):
+    """FHIR resource waiting to be written to the FHIR server"""
+
+    __tablename__ = "fhir_outbox"
+
+    id = db.Column(db.BigInteger, autoincrement=True, primary_key=True)
+    model_id = db.Column(db.Integer, nullable=True)
+    resource = db.Column(db.JSON, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # NULL once the entry gave up after the maximum number of attempts
+    next_attempt_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), nullable=True, index=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), nullable=False)
+
+    def __init__(self):
+        super(FhirOutbox, self).__init__()
+
+    def __repr__(self):
+        """Display when printing a fhir outbox object"""
+
+        return "<ID: {}, model id: {}, attempts: {}>".format(self.id, self.model_id, self.attempts)
+
+
+# the outbox is filled and drained from worker threads without an app context, so the engine is used instead of the session
+table = FhirOutbox.__table__
+INSERT_BATCH_SIZE = 1000
+
+
+def enqueue(model_id, resources):
+    """Queue the resources with multi-row INSERT statements in one transaction"""
+
+    rows = [{'model_id': model_id, 'resource': resource, 'attempts': 0} for resource in resources]
+    if not rows:
+        return 0
+
+    with db.engine.begin() as connection:
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            connection.execute(table.insert().values(rows[start:start + INSERT_BATCH_SIZE]))
+
+    return len(rows)
+
+
+def claim(limit):
+    """Lease a batch of due entries to this worker, entries locked by another worker are skipped"""
+
+    # an entry whose worker died before recording the result becomes due again once the lease ran out
+    statement = db.text('UPDATE fhir_outbox SET next_attempt_at = now() + make_interval(secs => :lease) '
+                        'WHERE id IN (SELECT id FROM fhir_outbox WHERE next_attempt_at <= now() '
+                        'ORDER BY id LIMIT :limit FOR UPDATE SKIP LOCKED) RETURNING *')
+
+    with db.engine.begin() as connection:
+        rows = connection.execute(statement, {'lease': config.FHIR_OUTBOX_LEASE, 'limit': limit}).fetchall()
+
+    return sorted(rows, key=lambda row: row.id)
+
+
+def record(rows, errors):
+    """Delete the written entries and schedule the retry of the failed ones"""
+
+    failed = {rows[error['index']].id: error['error'] for error in errors}
+    written = [row.id for row in rows if row.id not in failed]
+
+    with db.engine.begin() as connection:
+        if written:
+            connection.execute(table.delete().where(table.c.id.in_(written)))
+
+        for row in rows:
+            if row.id not in failed:
+                continue
+
+            attempts = row.attempts + 1
+            if attempts >= config.FHIR_OUTBOX_MAX_ATTEMPTS:
+                next_attempt_at = None
+            else:
+                delay = min(config.FHIR_OUTBOX_RETRY_DELAY * (2 ** row.attempts), config.FHIR_OUTBOX_MAX_RETRY_DELAY)
+                next_attempt_at = db.func.now() + db.func.make_interval(0, 0, 0, 0, 0, 0, delay)
+
+            connection.execute(table.update().where(table.c.id == row.id)
+                               .values(attempts=attempts, next_attempt_at=next_attempt_at, last_error=failed[row.id]))
+
+
+def drain(write, limit):
+    """Write a batch of due entries with write(rows) and return the number of entries handled
+
+    No transaction is open while the entries are written to FHIR, the claimed entries are protected by their lease.
+    """
+
+    rows = claim(limit)
+    if not rows:
+        return 0
+
+    record(rows, write(rows))
+
+    return len(rows)
+
+
+def get_stats():
+    pending = db.session.query(db.func.count(FhirOutbox.id), db.func.min(FhirOutbox.created_at))\
+        .filter(FhirOutbox.next_attempt_at.isnot(None)).one()
+    failed = db.session.query(db.func.count(FhirOutbox.id)).filter(FhirOutbox.next_attempt_at.is_(None)).scalar()
+    now = db.session.query(db.func.now()).scalar()
+
+    return {'pending': pending[0], 'failed': failed, 'oldest_pending_at': pending[1],
+            'lag_seconds': round((now - pending[1]).total_seconds(), 3) if pending[1] else 0.0}
@@ -2,7 +2,7 @@ from rdb.rdb import db, LowerCaseText
 import datetime
 from flask import g
 import rdb.models.environment as Environment
-import requests
+from util import containerClient as ContainerClient
 import rdb.models.featureSet as FeatureSet
 from flask_restful import abort
 import rdb.models.user as User
@@ -25,6 +25,8 @@ class MLModel(db.Model):
     created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
     updated_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), onupdate=datetime.datetime.now)
     feature_set_id = db.Column(db.Integer, db.ForeignKey('feature_set.id'), nullable=True)
+    prediction_jobs = db.relationship('PredictionJob', lazy='select', cascade='delete, delete-orphan')
+    prediction_schedules = db.relationship('PredictionSchedule', lazy='select', cascade='delete, delete-orphan')
 
     def __init__(self):
         super(MLModel, self).__init__()
@@ -63,7 +65,7 @@ def create(name, desc, env_id, feature_set_id, condition_refcode=None, condition
     params = None
     if create_example_model:
         params = {'createExampleModel': create_example_model}
-    resp = requests.post('http://' + e.container_name + ':5000/models', params=params).json()
+    resp = ContainerClient.post(e.container_name, '/models', params=params).json()
     m.ml_model_name = str(resp['modelName'])
 
     db.session.add(m)
@@ -0,0 +1,132 @@
+from rdb.rdb import db, LowerCaseText
+from enum import Enum
+import datetime
+import uuid
+from flask import g
+from flask_restful import abort
+import rdb.models.user as User
+
+
+class PredictionExport(db.Model):
+    """Bulk export of the stored predictions of a model as NDJSON files"""
+
+    __tablename__ = "prediction_export"
+
+    id = db.Column(db.Text, primary_key=True)
+    model_id = db.Column(db.Integer, db.ForeignKey('ml_model.id', ondelete='CASCADE'), nullable=False, index=True)
+    creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(LowerCaseText, nullable=False)
+    parameters = db.Column(db.JSON, nullable=True)
+    # one entry per finished file, in file order, so that files can be downloaded while the export is still running
+    files = db.Column(db.JSON, nullable=True)
+    unmapped = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+    started_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    finished_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+    def __init__(self):
+        super(PredictionExport, self).__init__()
+
+    def __repr__(self):
+        """Display when printing a prediction export object"""
+
+        return "<ID: {}, model id: {}, status: {}>".format(self.id, self.model_id, self.status)
+
+    def as_dict(self):
+        """Convert object to dictionary"""
+
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+    class Status(Enum):
+        queued = 'queued'
+        running = 'running'
+        finished = 'finished'
+        failed = 'failed'
+
+
+def create(model_id, parameters):
+    e = PredictionExport()
+    e.id = str(uuid.uuid4().hex)
+    e.model_id = model_id
+    e.creator_id = g.user.id
+    e.status = PredictionExport.Status.queued.value
+    e.parameters = parameters
+    e.files = []
+    e.unmapped = 0
+
+    db.session.add(e)
+    db.session.commit()
+
+    return e
+
+
+def abort_if_prediction_export_doesnt_exist(export_id):
+    abort(404, message="prediction export {} doesn't exist".format(export_id))
+
+
+def get(export_id, model_id=None, raise_abort=True):
+    e = PredictionExport.query.get(export_id)
+
+    if model_id is not None and e and e.model_id != model_id:
+        e = None
+
+    if raise_abort and not e:
+        abort_if_prediction_export_doesnt_exist(export_id)
+
+    if e and raise_abort:
+        User.check_request_for_logged_in_user(e.creator_id)
+
+    return e
+
+
+def is_done(e):
+    return e.status in (PredictionExport.Status.finished.value, PredictionExport.Status.failed.value)
+
+
+def set_running(e):
+    e.status = PredictionExport.Status.running.value
+    e.started_at = datetime.datetime.now(datetime.timezone.utc)
+    db.session.commit()
+
+    return e
+
+
+def add_file(e, resource_type, count, unmapped):
+    # a new list, changes inside a JSON column are not tracked
+    e.files = list(e.files or []) + [{'type': resource_type, 'count': count}]
+    e.unmapped = (e.unmapped or 0) + unmapped
+    db.session.commit()
+
+    return e
+
+
+def set_finished(e, unmapped):
+    e.status = PredictionExport.Status.finished.value
+    e.unmapped = (e.unmapped or 0) + unmapped
+    e.finished_at = datetime.datetime.now(datetime.timezone.utc)
+    db.session.commit()
+
+    return e
+
+
+def set_failed(e, error):
+    e.status = PredictionExport.Status.failed.value
+    e.error = error
+    e.finished_at = datetime.datetime.now(datetime.timezone.utc)
+    db.session.commit()
+
+    return e
+
+
+def delete(e):
+    db.session.delete(e)
+    db.session.commit()
+
+
+def fail_interrupted():
+    """Mark exports as failed which were queued or running when the service stopped"""
+
+    PredictionExport.query.filter(PredictionExport.status.in_([PredictionExport.Status.queued.value, PredictionExport.Status.running.value]))\
+        .update({'status': PredictionExport.Status.failed.value, 'error': 'interrupted by service restart'}, synchronize_session=False)
+    db.session.commit()
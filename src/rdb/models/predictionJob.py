@@ -0,0 +1,113 @@
+from rdb.rdb import db, LowerCaseText
+from enum import Enum
+import datetime
+import uuid
+from flask import g
+from flask_restful import abort
+import rdb.models.user as User
+
+
+class PredictionJob(db.Model):
+    """Prediction Job Class"""
+
+    __tablename__ = "prediction_job"
+
+    id = db.Column(db.Text, primary_key=True)
+    model_id = db.Column(db.Integer, db.ForeignKey('ml_model.id'), nullable=False, index=True)
+    creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(LowerCaseText, nullable=False)
+    parameters = db.Column(db.JSON, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    timings = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+    started_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    finished_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+    def __init__(self):
+        super(PredictionJob, self).__init__()
+
+    def __repr__(self):
+        """Display when printing a prediction job object"""
+
+        return "<ID: {}, model id: {}, status: {}>".format(self.id, self.model_id, self.status)
+
+    def as_dict(self):
+        """Convert object to dictionary"""
+
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+    class Status(Enum):
+        queued = 'queued'
+        running = 'running'
+        finished = 'finished'
+        failed = 'failed'
+
+
+def create(model_id, parameters):
+    j = PredictionJob()
+    j.id = str(uuid.uuid4().hex)
+    j.model_id = model_id
+    j.creator_id = g.user.id
+    j.status = PredictionJob.Status.queued.value
+    j.parameters = parameters
+
+    db.session.add(j)
+    db.session.commit()
+
+    return j
+
+
+def abort_if_prediction_job_doesnt_exist(job_id):
+    abort(404, message="prediction job {} doesn't exist".format(job_id))
+
+
+def get(job_id, model_id=None, raise_abort=True):
+    j = PredictionJob.query.get(job_id)
+
+    if model_id is not None and j and j.model_id != model_id:
+        j = None
+
+    if raise_abort and not j:
+        abort_if_prediction_job_doesnt_exist(job_id)
+
+    if j and raise_abort:
+        User.check_request_for_logged_in_user(j.creator_id)
+
+    return j
+
+
+def set_running(j):
+    j.status = PredictionJob.Status.running.value
+    j.started_at = datetime.datetime.now(datetime.timezone.utc)
+    db.session.commit()
+
+    return j
+
+
+def set_finished(j, result, timings):
+    j.status = PredictionJob.Status.finished.value
+    j.result = result
+    j.timings = timings
+    j.finished_at = datetime.datetime.now(datetime.timezone.utc)
+    db.session.commit()
+
+    return j
+
+
+def set_failed(j, error, timings=None):
+    j.status = PredictionJob.Status.failed.value
+    j.error = error
+    j.timings = timings
+    j.finished_at = datetime.datetime.now(datetime.timezone.utc)
+    db.session.commit()
+
+    return j
+
+
+def fail_interrupted():
+    """Mark jobs as failed which were queued or running when the service stopped"""
+
+    PredictionJob.query.filter(PredictionJob.status.in_([PredictionJob.Status.queued.value, PredictionJob.Status.running.value]))\
+        .update({'status': PredictionJob.Status.failed.value, 'error': 'interrupted by service restart'}, synchronize_session=False)
+    db.session.commit()
@@ -1,5 +1,7 @@
 from rdb.rdb import db
 from flask_restful import abort
+from util.cache import TTLCache
+import config
 
 
 class PredictionOutcome(db.Model):
@@ -27,6 +29,10 @@ class PredictionOutcome(db.Model):
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
 
+# outcomes per model as plain dicts, other workers see changes once their entry expires
+outcome_cache = TTLCache(maxsize=config.OUTCOME_CACHE_SIZE, ttl=config.OUTCOME_CACHE_TTL)
+
+
 def create(model_id, outcome_code, outcome_value, outcome_codesystem='KETOS'):
     p_o = PredictionOutcome()
     p_o.model_id = model_id
@@ -36,6 +42,7 @@ def create(model_id, outcome_code, outcome_value, outcome_codesystem='KETOS'):
 
     db.session.add(p_o)
     db.session.commit()
+    outcome_cache.pop(model_id)
     return p_o
 
 
@@ -57,7 +64,20 @@ def get_all():
 
 
 def get_all_for_model(model_id):
-    return PredictionOutcome.query.filter_by(model_id=model_id).all()
+    outcomes = outcome_cache.get(model_id)
+
+    if outcomes is None:
+        outcomes = tuple(p_o.as_dict() for p_o in PredictionOutcome.query.filter_by(model_id=model_id).all())
+        outcome_cache.set(model_id, outcomes)
+
+    return [dict(outcome) for outcome in outcomes]
+
+
+def get_outcome_map(model_id):
+    """Map of outcome value to outcome code of a model"""
+
+    return {outcome['outcome_value']: outcome['outcome_code'] for outcome in get_all_for_model(model_id)}
+
 
 def update(pred_outcome_id, outcome_codesystem, outcome_code, outcome_value, raise_abort=True):
     p_o = get(pred_outcome_id, raise_abort=raise_abort)
@@ -72,12 +92,15 @@ def update(pred_outcome_id, outcome_codesystem, outcome_code, outcome_value, rai
         p_o.outcome_value = outcome_value
 
     db.session.commit()
+    outcome_cache.pop(p_o.model_id)
     return p_o
 
 
 def delete(pred_outcome_id, raise_abort=True):
     p_o = get(pred_outcome_id, raise_abort=raise_abort)
 
+    model_id = p_o.model_id
     db.session.delete(p_o)
     db.session.commit()
+    outcome_cache.pop(model_id)
     return pred_outcome_id
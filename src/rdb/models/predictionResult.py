@@ -0,0 +1,65 @@
+from rdb.rdb import db
+import config
+
+
+class PredictionResult(db.Model):
+    """Prediction of a model for a single patient"""
+
+    __tablename__ = "prediction_result"
+    __table_args__ = (db.Index('ix_prediction_result_model_patient_created', 'model_id', 'patient_id', 'created_at'),)
+
+    id = db.Column(db.BigInteger, autoincrement=True, primary_key=True)
+    model_id = db.Column(db.Integer, db.ForeignKey('ml_model.id', ondelete='CASCADE'), nullable=False)
+    patient_id = db.Column(db.Integer, nullable=False)
+    prediction = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), nullable=False)
+
+    def __init__(self):
+        super(PredictionResult, self).__init__()
+
+    def __repr__(self):
+        """Display when printing a prediction result object"""
+
+        return "<model id: {}, patient id: {}, created at: {}>".format(self.model_id, self.patient_id, self.created_at)
+
+
+# results are written from worker threads without an app context, so the engine is used instead of the session
+table = PredictionResult.__table__
+
+
+def store(model_id, predictions):
+    """Insert the predictions with multi-row INSERT statements, predictions without an integer patient id are skipped"""
+
+    rows = []
+    for prediction in predictions:
+        try:
+            patient_id = int(prediction['patientId'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        rows.append({'model_id': model_id, 'patient_id': patient_id, 'prediction': prediction})
+
+    if not rows:
+        return 0
+
+    with db.engine.begin() as connection:
+        for start in range(0, len(rows), config.PREDICTION_RESULT_BATCH_SIZE):
+            connection.execute(table.insert().values(rows[start:start + config.PREDICTION_RESULT_BATCH_SIZE]))
+
+    return len(rows)
+
+
+def get_latest(model_id, patient_ids=None, after=None, limit=100):
+    """Latest result per patient ordered by patient id, starting after the given patient id"""
+
+    query = PredictionResult.query.filter(PredictionResult.model_id == model_id)
+
+    if patient_ids is not None:
+        query = query.filter(PredictionResult.patient_id.in_(patient_ids))
+
+    if after is not None:
+        query = query.filter(PredictionResult.patient_id > after)
+
+    # DISTINCT ON picks the newest row of each patient straight from the (model_id, patient_id, created_at) index
+    return query.distinct(PredictionResult.patient_id)\
+        .order_by(PredictionResult.patient_id, PredictionResult.created_at.desc())\
+        .limit(limit).all()
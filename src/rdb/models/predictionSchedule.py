@@ -0,0 +1,135 @@
+from rdb.rdb import db
+import datetime
+from flask import g
+from flask_restful import abort
+from croniter import croniter
+import rdb.models.mlModel as MLModel
+import rdb.models.user as User
+
+
+class PredictionSchedule(db.Model):
+    """Prediction Schedule Class"""
+
+    __tablename__ = "prediction_schedule"
+
+    id = db.Column(db.Integer, autoincrement=True, primary_key=True)
+    model_id = db.Column(db.Integer, db.ForeignKey('ml_model.id'), nullable=False, index=True)
+    cohort_id = db.Column(db.Integer, nullable=False)
+    cron = db.Column(db.Text, nullable=False)
+    write_to_fhir = db.Column(db.Boolean, nullable=False, default=False)
+    enabled = db.Column(db.Boolean, nullable=False, default=True)
+    creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    last_run_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    next_run_at = db.Column(db.DateTime(timezone=True), nullable=True, index=True)
+    runs = db.relationship('PredictionScheduleRun', lazy='select', cascade='delete, delete-orphan', backref='schedule')
+    watermarks = db.relationship('PredictionWatermark', lazy='dynamic', cascade='delete, delete-orphan')
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+    updated_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), onupdate=datetime.datetime.now)
+
+    def __init__(self):
+        super(PredictionSchedule, self).__init__()
+
+    def __repr__(self):
+        """Display when printing a prediction schedule object"""
+
+        return "<ID: {}, model id: {}, cohort id: {}, cron: {}>".format(self.id, self.model_id, self.cohort_id, self.cron)
+
+    def as_dict(self):
+        """Convert object to dictionary"""
+
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+    def set_next_run(self, base=None):
+        if base is None:
+            base = datetime.datetime.now(datetime.timezone.utc)
+
+        self.next_run_at = croniter(self.cron, base).get_next(datetime.datetime)
+
+
+def abort_if_cron_is_invalid(cron):
+    if not croniter.is_valid(cron):
+        abort(400, message="cron expression {} is not valid".format(cron))
+
+
+def create(model_id, cohort_id, cron, write_to_fhir=False, raise_abort=True):
+    m = MLModel.get(model_id, raise_abort=raise_abort)
+
+    if raise_abort:
+        abort_if_cron_is_invalid(cron)
+
+    s = PredictionSchedule()
+    s.model_id = m.id
+    s.cohort_id = cohort_id
+    s.cron = cron
+    s.write_to_fhir = bool(write_to_fhir)
+    s.enabled = True
+    s.creator_id = g.user.id
+    s.set_next_run()
+
+    db.session.add(s)
+    db.session.commit()
+
+    return s
+
+
+def abort_if_prediction_schedule_doesnt_exist(schedule_id):
+    abort(404, message="prediction schedule {} doesn't exist".format(schedule_id))
+
+
+def get(schedule_id, raise_abort=True):
+    s = PredictionSchedule.query.get(schedule_id)
+
+    if raise_abort and not s:
+        abort_if_prediction_schedule_doesnt_exist(schedule_id)
+
+    return s
+
+
+def get_all():
+    return PredictionSchedule.query.all()
+
+
+def get_all_for_user(user_id):
+    return PredictionSchedule.query.filter_by(creator_id=user_id).all()
+
+
+def get_due_for_update(now):
+    # rows locked by another worker are skipped, so every due schedule is started by exactly one worker
+    return PredictionSchedule.query.filter(PredictionSchedule.enabled.is_(True), PredictionSchedule.next_run_at <= now)\
+        .with_for_update(skip_locked=True).all()
+
+
+def update(schedule_id, cohort_id=None, cron=None, write_to_fhir=None, enabled=None, raise_abort=True):
+    s = get(schedule_id, raise_abort=raise_abort)
+
+    User.check_request_for_logged_in_user(s.creator_id)
+
+    if cohort_id:
+        s.cohort_id = cohort_id
+
+    if cron:
+        abort_if_cron_is_invalid(cron)
+        s.cron = cron
+        s.set_next_run()
+
+    if write_to_fhir is not None:
+        s.write_to_fhir = write_to_fhir
+
+    if enabled is not None:
+        s.enabled = enabled
+        if enabled:
+            s.set_next_run()
+
+    db.session.commit()
+    return s
+
+
+def delete(schedule_id, raise_abort=True):
+    s = get(schedule_id, raise_abort=raise_abort)
+
+    User.check_request_for_logged_in_user(s.creator_id)
+
+    db.session.delete(s)
+    db.session.commit()
+
+    return schedule_id
@@ -0,0 +1,71 @@
+from rdb.rdb import db, LowerCaseText
+from enum import Enum
+import datetime
+
+
+class PredictionScheduleRun(db.Model):
+    """Prediction Schedule Run Class"""
+
+    __tablename__ = "prediction_schedule_run"
+
+    id = db.Column(db.Integer, autoincrement=True, primary_key=True)
+    schedule_id = db.Column(db.Integer, db.ForeignKey('prediction_schedule.id'), nullable=False, index=True)
+    status = db.Column(LowerCaseText, nullable=False)
+    patients_total = db.Column(db.Integer, nullable=False, default=0)
+    patients_scored = db.Column(db.Integer, nullable=False, default=0)
+    # patients whose data did not change since they were scored, so their prediction was kept
+    patients_reused = db.Column(db.Integer, nullable=False, default=0)
+    # stale patients which were sent to scoring, but got no prediction back
+    patients_unscored = db.Column(db.Integer, nullable=False, default=0)
+    timings = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    started_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    finished_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+    def __init__(self):
+        super(PredictionScheduleRun, self).__init__()
+
+    def __repr__(self):
+        """Display when printing a prediction schedule run object"""
+
+        return "<ID: {}, schedule id: {}, status: {}>".format(self.id, self.schedule_id, self.status)
+
+    def as_dict(self):
+        """Convert object to dictionary"""
+
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+    class Status(Enum):
+        running = 'running'
+        finished = 'finished'
+        failed = 'failed'
+
+
+def create(schedule_id):
+    r = PredictionScheduleRun()
+    r.schedule_id = schedule_id
+    r.status = PredictionScheduleRun.Status.running.value
+    r.started_at = datetime.datetime.now(datetime.timezone.utc)
+
+    db.session.add(r)
+    db.session.commit()
+
+    return r
+
+
+def get_all_for_schedule(schedule_id):
+    return PredictionScheduleRun.query.filter_by(schedule_id=schedule_id).order_by(PredictionScheduleRun.started_at.desc()).all()
+
+
+def finish(r, patients_total, patients_scored, patients_reused, patients_unscored, timings, error=None):
+    r.status = PredictionScheduleRun.Status.failed.value if error else PredictionScheduleRun.Status.finished.value
+    r.patients_total = patients_total
+    r.patients_scored = patients_scored
+    r.patients_reused = patients_reused
+    r.patients_unscored = patients_unscored
+    r.timings = timings
+    r.error = error
+    r.finished_at = datetime.datetime.now(datetime.timezone.utc)
+
+    db.session.commit()
+    return r
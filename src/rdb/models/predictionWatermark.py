@@ -0,0 +1,64 @@
+from rdb.rdb import db
+from sqlalchemy.dialects.postgresql import insert
+import datetime
+
+
+class PredictionWatermark(db.Model):
+    """Last scored state of a patient for a prediction schedule"""
+
+    __tablename__ = 'prediction_watermark'
+
+    schedule_id = db.Column(db.Integer, db.ForeignKey('prediction_schedule.id'), primary_key=True)
+    patient_id = db.Column(db.Integer, primary_key=True)
+    # newest source data of the patient at the time of scoring, as found in the omop cdm (without time zone)
+    watermark = db.Column(db.DateTime(timezone=False), nullable=True)
+    prediction = db.Column(db.JSON, nullable=True)
+    updated_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), onupdate=datetime.datetime.now)
+
+    def __init__(self):
+        super(PredictionWatermark, self).__init__()
+
+    def __repr__(self):
+        """Display when printing a prediction watermark object"""
+
+        return "<schedule id: {}, patient id: {}, watermark: {}>".format(self.schedule_id, self.patient_id, self.watermark)
+
+    def as_dict(self):
+        """Convert object to dictionary"""
+
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+def get_for_patients(schedule_id, patient_ids):
+    watermarks = PredictionWatermark.query.filter(PredictionWatermark.schedule_id == schedule_id, PredictionWatermark.patient_id.in_(patient_ids)).all()
+
+    return {w.patient_id: w for w in watermarks}
+
+
+def get_page(schedule_id, after=None, limit=100):
+    """Watermarks of a schedule ordered by patient id, starting after the given patient id"""
+
+    query = PredictionWatermark.query.filter_by(schedule_id=schedule_id)
+
+    if after is not None:
+        query = query.filter(PredictionWatermark.patient_id > after)
+
+    return query.order_by(PredictionWatermark.patient_id).limit(limit).all()
+
+
+def upsert(schedule_id, rows):
+    """Insert or update (patient id, watermark, prediction) rows in one statement"""
+
+    if not rows:
+        return
+
+    values = [{'schedule_id': schedule_id, 'patient_id': patient_id, 'watermark': watermark, 'prediction': prediction}
+              for patient_id, watermark, prediction in rows]
+    statement = insert(PredictionWatermark.__table__).values(values)
+    statement = statement.on_conflict_do_update(index_elements=['schedule_id', 'patient_id'],
+                                                set_={'watermark': statement.excluded.watermark,
+                                                      'prediction': statement.excluded.prediction,
+                                                      'updated_at': db.func.now()})
+
+    db.session.execute(statement)
+    db.session.commit()
@@ -0,0 +1,78 @@
+from rdb.rdb import db
+from sqlalchemy.dialects.postgresql import insert
+import hashlib
+import json
+import config
+
+
+class RiskAssessmentFingerprint(db.Model):
+    """Fingerprint of the RiskAssessment last written to FHIR for a patient and model"""
+
+    __tablename__ = 'risk_assessment_fingerprint'
+
+    model_id = db.Column(db.Integer, db.ForeignKey('ml_model.id', ondelete='CASCADE'), primary_key=True)
+    patient_id = db.Column(db.String(64), primary_key=True)
+    fingerprint = db.Column(db.String(40), nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), nullable=False)
+
+    def __init__(self):
+        super(RiskAssessmentFingerprint, self).__init__()
+
+    def __repr__(self):
+        """Display when printing a risk assessment fingerprint object"""
+
+        return "<model id: {}, patient id: {}, fingerprint: {}>".format(self.model_id, self.patient_id, self.fingerprint)
+
+
+# fingerprints are read and written from worker threads without an app context, so the engine is used instead of the session
+table = RiskAssessmentFingerprint.__table__
+
+
+def get_patient_id(resource):
+    return resource['subject']['reference'].split('/', 1)[-1]
+
+
+def get_fingerprint(resource):
+    """Hash of the parts of a RiskAssessment which change with the prediction"""
+
+    content = json.dumps([resource.get('condition'), resource.get('prediction')], sort_keys=True)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def get_changed(model_id, resources):
+    """Resources whose fingerprint differs from the one last written for their patient"""
+
+    fingerprints = {get_patient_id(resource): get_fingerprint(resource) for resource in resources}
+    patient_ids = list(fingerprints)
+    written = {}
+
+    with db.engine.connect() as connection:
+        for start in range(0, len(patient_ids), config.PREDICTION_RESULT_BATCH_SIZE):
+            statement = table.select().where(table.c.model_id == model_id)\
+                .where(table.c.patient_id.in_(patient_ids[start:start + config.PREDICTION_RESULT_BATCH_SIZE]))
+            written.update((row.patient_id, row.fingerprint) for row in connection.execute(statement))
+
+    return [resource for resource in resources if written.get(get_patient_id(resource)) != fingerprints[get_patient_id(resource)]]
+
+
+def store(entries):
+    """Remember (model id, resource) entries as written, the last entry of a patient wins"""
+
+    rows = {}
+    for model_id, resource in entries:
+        patient_id = get_patient_id(resource)
+        rows[(model_id, patient_id)] = {'model_id': model_id, 'patient_id': patient_id, 'fingerprint': get_fingerprint(resource)}
+
+    rows = list(rows.values())
+    if not rows:
+        return 0
+
+    with db.engine.begin() as connection:
+        for start in range(0, len(rows), config.PREDICTION_RESULT_BATCH_SIZE):
+            statement = insert(table).values(rows[start:start + config.PREDICTION_RESULT_BATCH_SIZE])
+            statement = statement.on_conflict_do_update(index_elements=['model_id', 'patient_id'],
+                                                        set_={'fingerprint': statement.excluded.fingerprint,
+                                                              'updated_at': db.func.now()})
+            connection.execute(statement)
+
+    return len(rows)
@@ -4,10 +4,24 @@ import datetime
 from flask_restful import abort
 from resources.adminAccess import is_admin_user
 from flask import g
-from flask_httpauth import HTTPBasicAuth
+from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth, MultiAuth
+from sqlalchemy.orm import deferred, undefer
+from util.cache import TTLCache
+from util import authToken as AuthToken
+import rdb.models.authTokenRevocation as AuthTokenRevocation
+import config
+import hashlib
+import hmac
+import os
 
 
-auth = HTTPBasicAuth()
+basic_auth = HTTPBasicAuth()
+token_auth = HTTPTokenAuth(scheme='Bearer')
+auth = MultiAuth(basic_auth, token_auth)
+
+# verified credentials are remembered under a keyed hash so that repeated requests skip the expensive password hash
+credential_cache = TTLCache(maxsize=config.CREDENTIAL_CACHE_SIZE, ttl=config.CREDENTIAL_CACHE_TTL)
+credential_cache_secret = os.urandom(32)
 
 
 class User(db.Model):
@@ -20,13 +34,14 @@ class User(db.Model):
     last_name = db.Column(db.Text, nullable=True)
     username = db.Column(LowerCaseText, unique=True, index=True, nullable=False)
     email = db.Column(LowerCaseText, unique=True, index=True, nullable=False)
-    password_hash = db.Column(db.Text, nullable=False)
+    # deferred, so that nested creators only load the public user columns
+    password_hash = deferred(db.Column(db.Text, nullable=False))
     created_images = db.relationship('Image', lazy=True, backref='creator')
     created_environments = db.relationship('Environment', lazy=True, backref='creator')
     created_ml_models = db.relationship('MLModel', lazy=True, backref='creator')
     created_features = db.relationship('Feature', lazy=True, backref='creator')
     created_feature_sets = db.relationship('FeatureSet', lazy=True, backref='creator')
-    data_requests = db.relationship('DataRequest', lazy='subquery', secondary='user_data_request')
+    data_requests = db.relationship('DataRequest', lazy='select', secondary='user_data_request')
     # accessible_evironments = db.relationship('Environment', lazy='subquery', secondary='user_environment_access')
     created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
     updated_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), onupdate=datetime.datetime.now)
@@ -51,31 +66,94 @@ class User(db.Model):
         return pwd_context.verify(password, self.password_hash)
 
 
-@auth.verify_password
+class TokenUser(object):
+    """Authenticated user taken from a signed auth token without loading it from the rdb"""
+
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+    def __repr__(self):
+        """Display when printing a token user object"""
+
+        return "<ID: {}, username: {}>".format(self.id, self.username)
+
+
+def get_credential_cache_key(username, password, password_hash):
+    msg = '\0'.join([str(username).lower(), str(password), password_hash]).encode('utf-8')
+    return hmac.new(credential_cache_secret, msg, hashlib.sha256).digest()
+
+
+def invalidate_credential_cache(user_id):
+    return credential_cache.remove_if(lambda key, cached_user_id: cached_user_id == user_id)
+
+
+# loader options per use case, the default loads neither the password hash nor any relationship
+load_profiles = {
+    'default': (),
+    'auth': (undefer(User.password_hash),)
+}
+
+
+@basic_auth.verify_password
 def verify_password(username, password):
-    u = get_by_username(username, raise_abort=False)
+    u = get_by_username(username, raise_abort=False, profile='auth')
 
-    if not u or not u.verify_password(password):
+    if not u:
         return False
+
+    # the password hash is part of the key, so a changed password never matches an old entry
+    key = get_credential_cache_key(username, password, u.password_hash)
+    if credential_cache.get(key) != u.id:
+        if not u.verify_password(password):
+            return False
+        credential_cache.set(key, u.id)
+
     g.user = u
     return True
 
 
+@token_auth.verify_token
+def verify_token(token):
+    payload = AuthToken.load_token(token)
+
+    if not payload or AuthTokenRevocation.is_revoked(payload):
+        return False
+
+    g.user = TokenUser(payload['id'], payload['username'])
+    g.auth_token = payload
+    return True
+
+
+def generate_auth_token(user):
+    return AuthToken.generate_token(user)
+
+
+def revoke_auth_tokens(user_id):
+    # the current token is revoked on its own, otherwise all tokens of the user are revoked
+    payload = g.get('auth_token', None)
+    if payload and payload['id'] == user_id:
+        AuthTokenRevocation.revoke_token(payload)
+    else:
+        AuthTokenRevocation.revoke_all_for_user(user_id)
+
+
 def check_request_for_logged_in_user(user_id):
     if not (is_admin_user() or user_id == g.user.id):
         abort(403, message='only the creator or an admin has the permission to use this method')
 
 
-def get_by_username(username, raise_abort=True):
+def get_by_username(username, raise_abort=True, profile='default'):
     # is username the real username or the email
     # username: not @ contained
     # email: @ contained
     username = str(username)
     u = None
+    query = User.query.options(*load_profiles[profile])
     if "@" in username:
-        u = User.query.filter_by(email=username.lower()).first()
+        u = query.filter_by(email=username.lower()).first()
     else:
-        u = User.query.filter_by(username=username.lower()).first()
+        u = query.filter_by(username=username.lower()).first()
 
     if raise_abort and not u:
         abort_if_user_doesnt_exist(username)
@@ -87,8 +165,8 @@ def abort_if_user_doesnt_exist(user_id):
         abort(404, message="user {} doesn't exist".format(user_id))
 
 
-def get(user_id, raise_abort=True):
-    u = User.query.get(user_id)
+def get(user_id, raise_abort=True, profile='default'):
+    u = User.query.options(*load_profiles[profile]).get(user_id)
 
     if raise_abort and not u:
         abort_if_user_doesnt_exist(user_id)
@@ -135,6 +213,14 @@ def update(user_id, username=None, email=None, password=None, first_name=None, l
         u.last_name = last_name
 
     db.session.commit()
+
+    if username or email or password:
+        invalidate_credential_cache(u.id)
+
+    # tokens carry the username, so they are revoked on a rename as well
+    if username or password:
+        AuthTokenRevocation.revoke_all_for_user(u.id)
+
     return u, 200
 
 
@@ -146,4 +232,7 @@ def delete(user_id, raise_abort=True):
     db.session.delete(u)
     db.session.commit()
 
+    invalidate_credential_cache(u.id)
+    AuthTokenRevocation.revoke_all_for_user(u.id)
+
     return user_id
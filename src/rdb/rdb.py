@@ -29,6 +29,7 @@ def create_all():
 
     from rdb.models.user import User
     from rdb.models.environment import Environment
+    from rdb.models.environmentReplica import EnvironmentReplica
     # from rdb.models.userEnvironmentAccess import UserEnvironmentAccess
     from rdb.models.image import Image
     from rdb.models.mlModel import MLModel
@@ -38,11 +39,39 @@ def create_all():
     from rdb.models.predictionOutcome import PredictionOutcome
     from rdb.models.dataRequest import DataRequest
     from rdb.models.userDataRequest import UserDataRequest
+    from rdb.models.authTokenRevocation import AuthTokenRevocation
+    from rdb.models.predictionJob import PredictionJob
+    from rdb.models.predictionSchedule import PredictionSchedule
+    from rdb.models.predictionScheduleRun import PredictionScheduleRun
+    from rdb.models.predictionWatermark import PredictionWatermark
+    from rdb.models.crawlerJobCleanup import CrawlerJobCleanup
+    from rdb.models.predictionResult import PredictionResult
+    from rdb.models.fhirOutbox import FhirOutbox
+    from rdb.models.riskAssessmentFingerprint import RiskAssessmentFingerprint
+    from rdb.models.predictionExport import PredictionExport
 
     db.create_all()
     db.session.commit()
 
 
+def delete_expired_auth_token_revocations():
+    """remove revocations of auth tokens which have expired anyway"""
+
+    import rdb.models.authTokenRevocation as AuthTokenRevocation
+
+    AuthTokenRevocation.delete_expired()
+
+
+def fail_interrupted_prediction_jobs():
+    """mark prediction jobs and exports as failed which did not finish before the last shutdown"""
+
+    import rdb.models.predictionJob as PredictionJob
+    import rdb.models.predictionExport as PredictionExport
+
+    PredictionJob.fail_interrupted()
+    PredictionExport.fail_interrupted()
+
+
 def create_admin_user():
     """create admin user while startup"""
 
@@ -1,14 +1,19 @@
 import psycopg2
 import config
+import uuid
+
+
+def connect():
+    return psycopg2.connect(host=config.OMOP_ON_FHIR_HOST,
+                            database=config.OMOP_ON_FHIR_POSTGRES_DB,
+                            user=config.OMOP_ON_FHIR_POSTGRES_USER,
+                            password=config.OMOP_ON_FHIR_POSTGRES_PASSWORD,
+                            connect_timeout=3)
 
 
 connection = None
 try:
-    connection = psycopg2.connect(host=config.OMOP_ON_FHIR_HOST,
-                                  database=config.OMOP_ON_FHIR_POSTGRES_DB,
-                                  user=config.OMOP_ON_FHIR_POSTGRES_USER,
-                                  password=config.OMOP_ON_FHIR_POSTGRES_PASSWORD,
-                                  connect_timeout=3)
+    connection = connect()
 except psycopg2.OperationalError:
     pass
 
@@ -29,3 +34,67 @@ def get_patient_ids_for_atlas_cohort(cohort_id):
         ret.append(next_id[0])
 
     return ret
+
+
+def iter_patient_ids_for_atlas_cohort(cohort_id):
+    """Stream the patient ids of a cohort through a server-side cursor without loading all of them"""
+
+    if not connection:
+        return
+
+    # a named cursor lives in a transaction, so it gets its own connection instead of the shared one
+    stream_connection = connect()
+    try:
+        cursor = stream_connection.cursor(name='atlas_cohort_' + uuid.uuid4().hex)
+        cursor.itersize = config.OMOP_CURSOR_ITERSIZE
+        statement = 'SELECT subject_id FROM ohdsi.cohort WHERE cohort_definition_id = %s ORDER BY subject_id ASC'
+        cursor.execute(statement, (cohort_id,))
+
+        for row in cursor:
+            yield row[0]
+
+        cursor.close()
+    finally:
+        stream_connection.close()
+
+
+def get_data_watermarks(patient_ids, conn=None):
+    """Returns the time of the newest clinical data of each patient, patients without any data are left out"""
+
+    if conn is None:
+        conn = connection
+
+    if not conn or not patient_ids:
+        return dict()
+
+    schema = config.OMOP_CDM_SCHEMA
+    statement = 'SELECT person_id, MAX(ts) FROM (' \
+                'SELECT person_id, COALESCE(measurement_datetime, measurement_date) AS ts FROM ' + schema + '.measurement WHERE person_id = ANY(%(ids)s) ' \
+                'UNION ALL SELECT person_id, COALESCE(observation_datetime, observation_date) FROM ' + schema + '.observation WHERE person_id = ANY(%(ids)s) ' \
+                'UNION ALL SELECT person_id, COALESCE(condition_start_datetime, condition_start_date) FROM ' + schema + '.condition_occurrence WHERE person_id = ANY(%(ids)s)' \
+                ') data GROUP BY person_id'
+
+    cursor = conn.cursor()
+    cursor.execute(statement, {'ids': list(patient_ids)})
+    ret = {row[0]: row[1] for row in cursor.fetchall()}
+    cursor.close()
+
+    return ret
+
+
+def get_patient_ids_for_atlas_cohort_page(cohort_id, after=None, limit=100, conn=None):
+    """One page of the patient ids of a cohort in ascending order, starting after the given patient id"""
+
+    if conn is None:
+        conn = connection
+
+    if not conn:
+        return list()
+
+    cursor = conn.cursor()
+    statement = 'SELECT subject_id FROM ohdsi.cohort WHERE cohort_definition_id = %s AND subject_id > %s ORDER BY subject_id ASC LIMIT %s'
+    cursor.execute(statement, (cohort_id, after if after is not None else -1, limit))
+    ret = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+
+    return ret
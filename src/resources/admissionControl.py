@@ -0,0 +1,136 @@
+from collections import deque, OrderedDict
+from flask import g, Response
+from werkzeug.exceptions import TooManyRequests
+import config
+import functools
+import threading
+
+
+class AdmissionRejected(TooManyRequests):
+    description = 'Too many expensive requests of this user are running, retry later'
+
+    def __init__(self, retry_after):
+        # TooManyRequests sends the Retry-After header itself
+        super(AdmissionRejected, self).__init__(retry_after=retry_after)
+
+
+class Waiter(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class Controller(object):
+    """Concurrency budget per user for expensive requests of this worker process, waiting users are served round robin"""
+
+    def __init__(self, capacity, user_budget, queue_size, max_wait):
+        self.capacity = capacity
+        self.user_budget = user_budget
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.running = 0
+        self.running_by_user = {}
+        self.waiting = OrderedDict()
+        self.rejected = 0
+
+    def grant(self, user_id):
+        self.running += 1
+        self.running_by_user[user_id] = self.running_by_user.get(user_id, 0) + 1
+
+    def can_run(self, user_id):
+        return self.running < self.capacity and self.running_by_user.get(user_id, 0) < self.user_budget
+
+    def acquire(self, user_id):
+        with self.lock:
+            if user_id not in self.waiting and self.can_run(user_id):
+                self.grant(user_id)
+                return True
+
+            queue = self.waiting.setdefault(user_id, deque())
+            if len(queue) >= self.queue_size:
+                if not queue:
+                    del self.waiting[user_id]
+                self.rejected += 1
+                return False
+
+            waiter = Waiter()
+            queue.append(waiter)
+
+        waiter.event.wait(self.max_wait)
+
+        with self.lock:
+            if waiter.granted:
+                return True
+
+            queue = self.waiting.get(user_id)
+            if queue is not None:
+                queue.remove(waiter)
+                if not queue:
+                    del self.waiting[user_id]
+            self.rejected += 1
+            return False
+
+    def release(self, user_id):
+        with self.lock:
+            self.running -= 1
+            self.running_by_user[user_id] -= 1
+            if not self.running_by_user[user_id]:
+                del self.running_by_user[user_id]
+
+            self.dispatch()
+
+    def dispatch(self):
+        # one request per user and round, the served user moves to the end of the line
+        while self.running < self.capacity:
+            user_id = next((cur for cur in self.waiting if self.can_run(cur)), None)
+            if user_id is None:
+                return
+
+            queue = self.waiting[user_id]
+            waiter = queue.popleft()
+            if queue:
+                self.waiting.move_to_end(user_id)
+            else:
+                del self.waiting[user_id]
+
+            self.grant(user_id)
+            waiter.granted = True
+            waiter.event.set()
+
+    def stats(self):
+        with self.lock:
+            return {'running': self.running, 'waiting': sum(len(queue) for queue in self.waiting.values()), 'rejected': self.rejected}
+
+
+controller = Controller(capacity=config.ADMISSION_CAPACITY, user_budget=config.ADMISSION_USER_BUDGET,
+                        queue_size=config.ADMISSION_QUEUE_SIZE, max_wait=config.ADMISSION_MAX_WAIT)
+
+
+class AdmissionControl(object):
+    """Limits the expensive requests a single user may run at the same time, must be applied after login_required"""
+
+    def __init__(self):
+        return
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def decorated(*args, **kwargs):
+            user_id = g.user.id
+            if not controller.acquire(user_id):
+                raise AdmissionRejected(config.ADMISSION_RETRY_AFTER)
+
+            try:
+                resp = fn(*args, **kwargs)
+            except BaseException:
+                controller.release(user_id)
+                raise
+
+            # streamed responses keep working after the view returned, so their slot is freed when the response is closed
+            if isinstance(resp, Response):
+                resp.call_on_close(lambda: controller.release(user_id))
+            else:
+                controller.release(user_id)
+
+            return resp
+        return decorated
@@ -1,28 +1,21 @@
 from flask import g, Response
-from flask_restful import reqparse, abort, fields, marshal_with, marshal
+from flask_restful import reqparse, abort, marshal_with
 from flask_restful_swagger_2 import swagger, Resource
 from rdb.rdb import db
 from rdb.models.user import User
 from resources.userResource import auth
 import requests
 import config
-from rdb.models.featureSet import FeatureSet
+from util import crawlerUtil as CrawlerUtil
 import json
 import logging
 logger = logging.getLogger(__name__)
 from resources.adminAccess import AdminAccess
+from resources.admissionControl import AdmissionControl
 from resources.adminAccess import is_admin_user
 import rdb.models.dataRequest as DataRequest
 import sys
 
-feature_fields = {
-    'resource': fields.String,
-    'key': fields.String(attribute='parameter_name'),
-    'value': fields.String,
-    'name': fields.String,
-    'resource_val_path': fields.String(attribute='output_value_path')
-}
-
 
 class DataListResource(Resource):
     def __init__(self):
@@ -59,6 +52,7 @@ class DataListResource(Resource):
 
     @auth.login_required
     @AdminAccess()
+    @AdmissionControl()
     # todo: swagger
     def post(self):
         args = self.parser.parse_args()
@@ -69,26 +63,11 @@ class DataListResource(Resource):
         if ((feature_set is None and resource_name is None) or (feature_set is not None and resource_name is not None)):
             return "Must provide feature_set_id XOR resource_name", 400
 
-        preprocess_body = {'patient_ids' : patient_ids}
-
+        compiled = None
         if (feature_set is not None):
-            features = FeatureSet.query.get(feature_set).features
-            feature_set = []
-
-            for feature in features:
-                cur_feature = marshal(feature, feature_fields)
-
-                if cur_feature['resource_val_path'] is None:
-                    cur_feature.pop('resource_val_path', None)
-
-                feature_set.append(cur_feature)
-
-            preprocess_body["feature_set"] = feature_set
-        
-        if (resource_name is not None):
-            preprocess_body["resource"] = resource_name
+            compiled = CrawlerUtil.get_compiled_feature_set(feature_set)
 
-        resp = requests.post("http://" + config.DATA_PREPROCESSING_HOST + "/crawler/jobs", json=preprocess_body).json()
+        resp = CrawlerUtil.create_job(patient_ids, compiled=compiled, resource_name=resource_name)
 
         DataRequest.create(request_id=resp['id'])
         dr = DataRequest.add_users(resp['id'], [2])
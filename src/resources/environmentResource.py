@@ -1,8 +1,12 @@
 from flask_restful import reqparse, fields, marshal_with
 from flask_restful_swagger_2 import swagger, Resource
 import rdb.models.environment as Environment
+import rdb.models.environmentReplica as EnvironmentReplica
 from rdb.models.id import ID, id_fields
 from resources.userResource import auth, user_fields
+from resources.adminAccess import AdminAccess
+from resources.admissionControl import AdmissionControl
+from util import containerClient as ContainerClient
 
 environment_fields = {
     'id': fields.Integer,
@@ -21,6 +25,30 @@ environment_fields = {
 }
 
 
+container_metrics_fields = {
+    'container_name': fields.String,
+    'requests': fields.Integer,
+    'errors': fields.Integer,
+    'retries': fields.Integer,
+    'latency_avg': fields.Float,
+    'latency_max': fields.Float,
+    'last_error': fields.String,
+    'circuit': fields.String,
+    'outstanding': fields.Integer
+}
+
+
+environment_replica_fields = {
+    'id': fields.Integer,
+    'environment_id': fields.Integer,
+    'container_id': fields.String,
+    'container_name': fields.String,
+    'status': fields.String,
+    'created_at': fields.DateTime,
+    'updated_at': fields.DateTime
+}
+
+
 env_post_parser = reqparse.RequestParser()
 env_post_parser.add_argument('name', type=str, required=True, help='No environment name provided', location='json')
 env_post_parser.add_argument('status', type=str, required=False, location='json')
@@ -52,6 +80,7 @@ class EnvironmentListResource(Resource):
 
     @auth.login_required
     @marshal_with(environment_fields)
+    @AdmissionControl()
     @swagger.doc({
         "summary": "Create a new environment",
         "tags": ["environments"],
@@ -236,3 +265,117 @@ class UserEnvironmentListResource(Resource):
     })
     def get(self, user_id):
         return Environment.get_all_for_user(user_id), 200
+
+
+class EnvironmentMetricsResource(Resource):
+    def __init__(self):
+        super(EnvironmentMetricsResource, self).__init__()
+
+    @auth.login_required
+    @marshal_with(container_metrics_fields)
+    @AdminAccess()
+    @swagger.doc({
+        "summary": "Returns request metrics of the environment containers",
+        "tags": ["environments"],
+        "produces": [
+            "application/json"
+        ],
+        "description": 'Returns request count, errors, retries, latency (in seconds) and circuit state per environment container as seen by this worker process',
+        "responses": {
+            "200": {
+                "description": "Returns the list of container metrics"
+            }
+        }
+    })
+    def get(self):
+        return ContainerClient.get_metrics(), 200
+
+
+class EnvironmentReplicaListResource(Resource):
+    def __init__(self):
+        super(EnvironmentReplicaListResource, self).__init__()
+        self.parser = reqparse.RequestParser()
+        self.parser.add_argument('replicas', type=int, required=True, help='No number of replicas provided', location='json')
+
+    @auth.login_required
+    @marshal_with(environment_replica_fields)
+    @AdminAccess()
+    @swagger.doc({
+        "summary": "Returns the replicas of an environment",
+        "tags": ["environments"],
+        "produces": [
+            "application/json"
+        ],
+        "description": 'Returns the additional containers which share the scoring load of the environment',
+        "parameters": [
+            {
+                "name": "env_id",
+                "in": "path",
+                "type": "integer",
+                "description": "The ID of the environment",
+                "required": True
+            }
+        ],
+        "responses": {
+            "200": {
+                "description": "Returns the list of replicas"
+            },
+            "404": {
+                "description": "Not found error when environment doesn't exist"
+            }
+        }
+    })
+    def get(self, env_id):
+        return EnvironmentReplica.get_all_for_environment(env_id), 200
+
+    @auth.login_required
+    @marshal_with(environment_replica_fields)
+    @AdminAccess()
+    @swagger.doc({
+        "summary": "Scale the replicas of an environment",
+        "tags": ["environments"],
+        "produces": [
+            "application/json"
+        ],
+        "description": 'Starts or removes replica containers from the image and data directory of the environment, predictions are balanced across the environment and its running replicas',
+        "parameters": [
+            {
+                "name": "env_id",
+                "in": "path",
+                "type": "integer",
+                "description": "The ID of the environment",
+                "required": True
+            },
+            {
+                "name": "replicas",
+                "in": "body",
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "replicas": {
+                            "type": "integer"
+                        }
+                    }
+                },
+                "required": True
+            }
+        ],
+        "responses": {
+            "200": {
+                "description": "Returns the list of replicas after scaling"
+            },
+            "400": {
+                "description": "Number of replicas out of range"
+            },
+            "404": {
+                "description": "Not found error when environment doesn't exist"
+            },
+            "405": {
+                "description": "Environment must be running to add replicas"
+            }
+        }
+    })
+    def put(self, env_id):
+        args = self.parser.parse_args()
+
+        return EnvironmentReplica.scale(env_id, args['replicas']), 200
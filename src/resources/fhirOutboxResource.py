@@ -0,0 +1,42 @@
+from flask_restful import fields, marshal_with
+from flask_restful_swagger_2 import swagger, Resource
+import rdb.models.fhirOutbox as FhirOutbox
+from util import fhirUtil as FhirUtil
+from resources.userResource import auth
+from resources.adminAccess import AdminAccess
+
+
+fhir_outbox_fields = {
+    'pending': fields.Integer,
+    'failed': fields.Integer,
+    'oldest_pending_at': fields.DateTime,
+    'lag_seconds': fields.Float,
+    'worker': fields.Nested({key: fields.Integer for key in FhirUtil.COUNTERS})
+}
+
+
+class FhirOutboxResource(Resource):
+    def __init__(self):
+        super(FhirOutboxResource, self).__init__()
+
+    @auth.login_required
+    @marshal_with(fhir_outbox_fields)
+    @AdminAccess()
+    @swagger.doc({
+        "summary": "Returns depth and lag of the FHIR outbox",
+        "tags": ["fhir"],
+        "produces": [
+            "application/json"
+        ],
+        "description": 'Returns the number of resources waiting to be written to FHIR, the number of resources which gave up after too many failed attempts, the age of the oldest waiting resource in seconds and, under worker, how many risk assessments the answering worker wrote, failed to write, skipped as unchanged, could not map or queued since it started',
+        "responses": {
+            "200": {
+                "description": "Returns the outbox statistics"
+            }
+        }
+    })
+    def get(self):
+        stats = FhirOutbox.get_stats()
+        stats['worker'] = FhirUtil.get_counters()
+
+        return stats, 200
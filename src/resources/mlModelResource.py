@@ -1,20 +1,27 @@
-from flask import send_from_directory
+from flask import send_from_directory, Response, stream_with_context, url_for
 from flask_restful import reqparse, abort, fields, marshal_with, marshal
 from flask_restful_swagger_2 import swagger, Resource
 import rdb.models.mlModel as MLModel
-import rdb.models.predictionOutcome as PredictionOutcome
 from rdb.models.id import ID, id_fields
 from resources.userResource import auth, user_fields
+from resources.admissionControl import AdmissionControl
 from resources.environmentResource import environment_fields
 from resources.featureSetResource import feature_set_fields
-import requests
+import rdb.models.predictionJob as PredictionJob
+import rdb.models.predictionResult as PredictionResult
+import rdb.models.predictionExport as PredictionExport
+import rdb.util.omopDbConnection as OmopDbConnection
 import config
 from util import modelPackagingUtil
+from util import predictionUtil as PredictionUtil
+from util import predictionJobUtil as PredictionJobUtil
+from util import predictionExportUtil as PredictionExportUtil
+from util import deadline as Deadline
 from flask_restplus import inputs
 import werkzeug
-import fhirclient.models.riskassessment as fhir_ra
-import rdb.fhir_models.riskAssessment as fhir_ra_base
-import sys
+import json
+import logging
+logger = logging.getLogger(__name__)
 
 
 ml_model_fields = {
@@ -33,14 +40,53 @@ ml_model_fields = {
     'feature_set': fields.Nested(feature_set_fields)
 }
 
-feature_fields = {
-    'resource': fields.String,
-    'key': fields.String(attribute='parameter_name'),
-    'value': fields.String,
-    'name': fields.String,
-    'resource_val_path': fields.String(attribute='output_value_path')
+# chunk size of cohort predictions when chunking is disabled in the config
+COHORT_CHUNK_SIZE = 1000
+
+prediction_job_fields = {
+    'id': fields.String,
+    'model_id': fields.Integer,
+    'status': fields.String,
+    'error': fields.String,
+    'timings': fields.Raw,
+    'result': fields.Raw,
+    'created_at': fields.DateTime,
+    'started_at': fields.DateTime,
+    'finished_at': fields.DateTime
 }
 
+prediction_result_fields = {
+    'patient_id': fields.Integer,
+    'prediction': fields.Raw,
+    'created_at': fields.DateTime
+}
+
+prediction_export_fields = {
+    'id': fields.String,
+    'model_id': fields.Integer,
+    'status': fields.String,
+    'parameters': fields.Raw,
+    'unmapped': fields.Integer,
+    'error': fields.String,
+    'created_at': fields.DateTime,
+    'started_at': fields.DateTime,
+    'finished_at': fields.DateTime
+}
+
+
+def stream_ndjson(items):
+    """Stream one json document per line, an error ends the stream with an error line"""
+
+    def generate():
+        try:
+            for item in items:
+                yield json.dumps(item) + '\n'
+        except Exception as e:
+            logger.error("Streaming predictions failed: ", exc_info=True)
+            yield json.dumps({'error': str(e)}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 
 class MLModelListResource(Resource):
     def __init__(self):
@@ -305,6 +351,7 @@ class MLModelExportResource(Resource):
         super(MLModelExportResource, self).__init__()
 
     @auth.login_required
+    @AdmissionControl()
     @swagger.doc({
         "summary": "Exports a specific ML model",
         "tags": ["ml models"],
@@ -381,6 +428,7 @@ class MLModelImportResource(Resource):
         return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
     @auth.login_required
+    @AdmissionControl()
     @swagger.doc({
         "summary": "Import a ML model",
         "tags": ["ml models"],
@@ -551,72 +599,553 @@ class MLModelPredicitionResource(Resource):
         self.parser.add_argument('dataUrl', type=str, required=True, help='no data url provided', location='args')
 
     @auth.login_required
+    @AdmissionControl()
     def post(self, model_id):
         parser = reqparse.RequestParser()
         parser.add_argument('patient_ids', type=int, required=True, action='append', help='no patientIds provided', location='json')
         parser.add_argument('writeToFhir', type=inputs.boolean, required=False, location='args')
         parser.add_argument('ownInputData', type=inputs.boolean, required=False, location='args')
+        parser.add_argument('async', type=inputs.boolean, default=False, required=False, location='args')
+        parser.add_argument('chunkSize', type=int, required=False, location='args')
+        parser.add_argument('stream', type=str, choices=('ndjson',), required=False, location='args')
         args = parser.parse_args()
         patient_ids = args['patient_ids']
 
         ml_model = MLModel.get(model_id)
 
-        if args['ownInputData'] is False:
-            features = ml_model.feature_set.features
-            feature_set = []
+        if args['stream'] == 'ndjson':
+            predictions = PredictionUtil.iter_predictions(ml_model, patient_ids, own_input_data=args['ownInputData'], write_to_fhir=args['writeToFhir'],
+                                                          chunk_size=args['chunkSize'], deadline=Deadline.from_request(use_default=False))
+            return stream_ndjson(predictions)
 
-            for feature in features:
-                cur_feature = marshal(feature, feature_fields)
+        if args['async']:
+            # a background job only has a deadline if the client sent one
+            j = PredictionJobUtil.submit(ml_model.id, patient_ids, own_input_data=args['ownInputData'], write_to_fhir=args['writeToFhir'],
+                                         chunk_size=args['chunkSize'], deadline=Deadline.from_request(use_default=False))
+            return marshal(j, prediction_job_fields), 202
 
-                if cur_feature['resource_val_path'] is None:
-                    cur_feature.pop('resource_val_path', None)
-                
-                feature_set.append(cur_feature)
-            
-            preprocess_body = {'patient': patient_ids, 'feature_set': feature_set}
+        return PredictionUtil.run(ml_model, patient_ids, own_input_data=args['ownInputData'], write_to_fhir=args['writeToFhir'],
+                                  chunk_size=args['chunkSize'], deadline=Deadline.from_request()), 200
 
-            resp = requests.post('http://' + config.DATA_PREPROCESSING_HOST + '/crawler', json=preprocess_body).json()
-            csv_url = resp['csv_url']
-            csv_url = csv_url.replace("localhost", "data_pre")
 
-            data_url = {'dataUrl': csv_url}
-            docker_api_call = 'http://' + ml_model.environment.container_name + ':5000/models/' + ml_model.ml_model_name + '/execute'
+class MLModelCohortPredictionResource(Resource):
+    def __init__(self):
+        super(MLModelCohortPredictionResource, self).__init__()
+        self.parser = reqparse.RequestParser()
+        self.parser.add_argument('writeToFhir', type=inputs.boolean, required=False, location='args')
+        self.parser.add_argument('chunkSize', type=int, required=False, location='args')
+        self.parser.add_argument('stream', type=str, choices=('ndjson',), required=False, location='args')
 
-            predictions = requests.get(docker_api_call, params=data_url).json()
-            res = requests.delete('http://' + config.DATA_PREPROCESSING_HOST + '/crawler/jobs/' + resp['crawler_id'])
-        else:
-            data_url = {'dataUrl': ""}
-            docker_api_call = 'http://' + ml_model.environment.container_name + ':5000/models/' + ml_model.ml_model_name + '/execute'
-            predictions = requests.get(docker_api_call, params=data_url).json()
+    @auth.login_required
+    @AdmissionControl()
+    @swagger.doc({
+        "summary": "Score all patients of an Atlas cohort",
+        "tags": ["ml models"],
+        "produces": [
+            "application/json",
+            "application/x-ndjson"
+        ],
+        "description": 'Reads the patient IDs of the Atlas cohort server-side and crawls and scores them chunk by chunk',
+        "parameters": [
+            {
+                "name": "model_id",
+                "in": "path",
+                "type": "integer",
+                "description": "The ID of the ML model",
+                "required": True
+            },
+            {
+                "name": "cohort_id",
+                "in": "path",
+                "type": "integer",
+                "description": "The ID of the atlas cohort",
+                "required": True
+            },
+            {
+                "name": "writeToFhir",
+                "in": "query",
+                "type": "boolean",
+                "description": "Flag whether to write the predictions to FHIR",
+                "required": False
+            },
+            {
+                "name": "chunkSize",
+                "in": "query",
+                "type": "integer",
+                "description": "Number of patients crawled and scored together",
+                "required": False
+            },
+            {
+                "name": "stream",
+                "in": "query",
+                "type": "string",
+                "description": "Set to ndjson to stream one prediction per line",
+                "required": False
+            }
+        ],
+        "responses": {
+            "200": {
+                "description": "Returns the predictions for all patients of the cohort"
+            },
+            "400": {
+                "description": "ML model without feature set given"
+            },
+            "404": {
+                "description": "Not found error when ML model doesn't exist"
+            },
+            "503": {
+                "description": "Environment container unavailable, retry after the time in the Retry-After header"
+            },
+            "504": {
+                "description": "Deadline of the request (X-Request-Deadline header, unix time in seconds) passed"
+            }
+        }
+    })
+    def post(self, model_id, cohort_id):
+        args = self.parser.parse_args()
+
+        ml_model = MLModel.get(model_id)
+        if not ml_model.feature_set_id:
+            abort(400, message="model {} has no feature set".format(model_id))
+
+        # the cohort is read lazily and can only be scored in chunks, even when PREDICTION_CHUNK_SIZE disables chunking
+        chunk_size = args['chunkSize']
+        if not chunk_size or chunk_size <= 0:
+            chunk_size = config.PREDICTION_CHUNK_SIZE if config.PREDICTION_CHUNK_SIZE > 0 else COHORT_CHUNK_SIZE
+
+        # a streamed cohort may take as long as it needs unless the client sets a deadline
+        deadline = Deadline.from_request(use_default=args['stream'] != 'ndjson')
+        patient_ids = OmopDbConnection.iter_patient_ids_for_atlas_cohort(cohort_id)
+        predictions = PredictionUtil.iter_predictions(ml_model, patient_ids, own_input_data=False, write_to_fhir=args['writeToFhir'], chunk_size=chunk_size,
+                                                      deadline=deadline)
+
+        if args['stream'] == 'ndjson':
+            return stream_ndjson(predictions)
 
         if args['writeToFhir'] is not False:
-            return self.predict_fhir_request(predictions, model_id)
+            return list(predictions), 200
+
+        return {'cohort_id': cohort_id, 'prediction': list(predictions)}, 200
+
+
+class MLModelMultiPredictionResource(Resource):
+    def __init__(self):
+        super(MLModelMultiPredictionResource, self).__init__()
+        self.parser = reqparse.RequestParser()
+        self.parser.add_argument('model_ids', type=int, required=True, action='append', help='no model ids provided', location='json')
+        self.parser.add_argument('patient_ids', type=int, required=True, action='append', help='no patientIds provided', location='json')
+        self.parser.add_argument('writeToFhir', type=inputs.boolean, required=False, location='args')
+
+    @auth.login_required
+    @AdmissionControl()
+    @swagger.doc({
+        "summary": "Score several ML models on the same patients",
+        "tags": ["ml models"],
+        "produces": [
+            "application/json"
+        ],
+        "description": 'Crawls the data of every distinct feature set of the given models once and scores all models sharing a feature set from the same data',
+        "parameters": [
+            {
+                "name": "writeToFhir",
+                "in": "query",
+                "type": "boolean",
+                "description": "Flag whether to write the predictions to FHIR",
+                "required": False
+            },
+            {
+                "name": "prediction",
+                "in": "body",
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "model_ids": {
+                            "type": "array",
+                            "items": {
+                                "type": "integer"
+                            }
+                        },
+                        "patient_ids": {
+                            "type": "array",
+                            "items": {
+                                "type": "integer"
+                            }
+                        }
+                    }
+                }
+            }
+        ],
+        "responses": {
+            "200": {
+                "description": "Returns the predictions or the error per ML model"
+            },
+            "400": {
+                "description": "ML model without feature set given"
+            },
+            "404": {
+                "description": "Not found error when a ML model doesn't exist"
+            },
+            "503": {
+                "description": "Environment container unavailable, retry after the time in the Retry-After header"
+            },
+            "504": {
+                "description": "Deadline of the request (X-Request-Deadline header, unix time in seconds) passed"
+            }
+        }
+    })
+    def post(self):
+        args = self.parser.parse_args()
+
+        ml_models = []
+        for model_id in args['model_ids']:
+            ml_model = MLModel.get(model_id)
+            if not ml_model.feature_set_id:
+                abort(400, message="model {} has no feature set".format(model_id))
+            if ml_model not in ml_models:
+                ml_models.append(ml_model)
+
+        return {'models': PredictionUtil.run_many(ml_models, args['patient_ids'], write_to_fhir=args['writeToFhir'], deadline=Deadline.from_request())}, 200
+
+
+class MLModelPredictionJobResource(Resource):
+    def __init__(self):
+        super(MLModelPredictionJobResource, self).__init__()
+
+    @auth.login_required
+    @marshal_with(prediction_job_fields)
+    @swagger.doc({
+        "summary": "Returns a specific prediction job",
+        "tags": ["ml models"],
+        "produces": [
+            "application/json"
+        ],
+        "description": 'Returns status, timings and, when finished, the results of an asynchronous prediction job',
+        "responses": {
+            "200": {
+                "description": "Returns the prediction job with the given ID"
+            },
+            "404": {
+                "description": "Not found error when ML model or prediction job doesn't exist"
+            }
+        },
+        "parameters": [
+            {
+                "name": "model_id",
+                "in": "path",
+                "type": "integer",
+                "description": "The ID of the ML model",
+                "required": True
+            },
+            {
+                "name": "job_id",
+                "in": "path",
+                "type": "string",
+                "description": "The ID of the prediction job",
+                "required": True
+            }
+        ],
+    })
+    def get(self, model_id, job_id):
+        return PredictionJob.get(job_id, model_id=model_id), 200
 
-        return predictions, 200
 
-    # todo: swagger
-    def predict_fhir_request(self, predictions, model_id):
+class MLModelPredictionResultResource(Resource):
+    def __init__(self):
+        super(MLModelPredictionResultResource, self).__init__()
+        self.parser = reqparse.RequestParser()
+        self.parser.add_argument('patient_ids', type=int, required=False, action='append', location='args')
+        self.parser.add_argument('cohortId', type=int, required=False, location='args')
+        self.parser.add_argument('after', type=int, required=False, location='args')
+        self.parser.add_argument('limit', type=int, default=100, required=False, location='args')
+
+    @auth.login_required
+    @swagger.doc({
+        "summary": "Returns the latest stored prediction per patient",
+        "tags": ["ml models"],
+        "produces": [
+            "application/json"
+        ],
+        "description": 'Serves stored predictions without rescoring, ordered by patient ID. Pass the returned next value as after to get the following page',
+        "parameters": [
+            {
+                "name": "model_id",
+                "in": "path",
+                "type": "integer",
+                "description": "The ID of the ML model",
+                "required": True
+            },
+            {
+                "name": "patient_ids",
+                "in": "query",
+                "type": "array",
+                "items": {
+                    "type": "integer"
+                },
+                "collectionFormat": "multi",
+                "description": "Only return predictions of these patients",
+                "required": False
+            },
+            {
+                "name": "cohortId",
+                "in": "query",
+                "type": "integer",
+                "description": "Only return predictions of patients of this atlas cohort",
+                "required": False
+            },
+            {
+                "name": "after",
+                "in": "query",
+                "type": "integer",
+                "description": "Patient ID after which the page starts",
+                "required": False
+            },
+            {
+                "name": "limit",
+                "in": "query",
+                "type": "integer",
+                "description": "Maximum number of patients per page",
+                "required": False
+            }
+        ],
+        "responses": {
+            "200": {
+                "description": "Returns a page of stored predictions and the cursor of the next page"
+            },
+            "404": {
+                "description": "Not found error when ML model doesn't exist"
+            }
+        }
+    })
+    def get(self, model_id):
+        args = self.parser.parse_args()
+        ml_model = MLModel.get(model_id)
+        limit = min(max(args['limit'], 1), config.PREDICTION_RESULT_PAGE_LIMIT)
+        ret = {'model_id': ml_model.id, 'results': [], 'next': None}
+
+        if args['cohortId'] is not None:
+            # the page is taken from the cohort, so patients without a stored prediction are reported as missing
+            patient_ids = OmopDbConnection.get_patient_ids_for_atlas_cohort_page(args['cohortId'], after=args['after'], limit=limit)
+            results = PredictionResult.get_latest(ml_model.id, patient_ids=patient_ids, limit=limit) if patient_ids else []
+            found = set(r.patient_id for r in results)
+            ret['missing'] = [patient_id for patient_id in patient_ids if patient_id not in found]
+            if len(patient_ids) == limit:
+                ret['next'] = patient_ids[-1]
+        else:
+            results = PredictionResult.get_latest(ml_model.id, patient_ids=args['patient_ids'], after=args['after'], limit=limit)
+            if len(results) == limit:
+                ret['next'] = results[-1].patient_id
+
+        ret['results'] = marshal(results, prediction_result_fields)
+
+        return ret, 200
+
+
+def get_prediction_export_manifest(e):
+    """Status of an export with the download url of every finished file, in the style of a FHIR bulk data manifest"""
+
+    ret = marshal(e, prediction_export_fields)
+    ret['output'] = [{'type': f['type'], 'count': f['count'],
+                      'url': url_for('model_prediction_export_file', model_id=e.model_id, export_id=e.id, file_number=number, _external=True)}
+                     for number, f in enumerate(e.files or [], 1)]
+
+    return ret
+
+
+class MLModelPredictionExportListResource(Resource):
+    def __init__(self):
+        super(MLModelPredictionExportListResource, self).__init__()
+        self.parser = reqparse.RequestParser()
+        self.parser.add_argument('cohortId', type=int, required=False, location='args')
+
+    @auth.login_required
+    @swagger.doc({
+        "summary": "Starts a bulk export of the stored predictions of a model",
+        "tags": ["ml models"],
+        "produces": [
+            "application/json"
+        ],
+        "description": 'Writes the latest stored prediction per patient as FHIR RiskAssessment NDJSON files in the background, '
+                       'without rescoring and without the FHIR server. Poll the URL in the Content-Location header for the files',
+        "parameters": [
+            {
+                "name": "model_id",
+                "in": "path",
+                "type": "integer",
+                "description": "The ID of the ML model",
+                "required": True
+            },
+            {
+                "name": "cohortId",
+                "in": "query",
+                "type": "integer",
+                "description": "Only export predictions of patients of this atlas cohort",
+                "required": False
+            }
+        ],
+        "responses": {
+            "202": {
+                "description": "The export was started"
+            },
+            "404": {
+                "description": "Not found error when ML model doesn't exist"
+            }
+        }
+    })
+    def post(self, model_id):
+        args = self.parser.parse_args()
         ml_model = MLModel.get(model_id)
-        risk_ass = fhir_ra.RiskAssessment(fhir_ra_base.fhir__base_risk_assessment)
-        cond_ref = ml_model.condition_refcode
-        risk_ass.condition = {"reference": cond_ref}
-        model_outcomes = PredictionOutcome.get_all_for_model(model_id)
-        outcomes = {}
-        for outcome in model_outcomes:
-            outcomes[outcome.outcome_value] = outcome.outcome_code
-
-        patient_prediction = fhir_ra_base.fhir_base_patient_prediction
-        risk_ass.prediction = [patient_prediction]
-        predictions = predictions['prediction']
-        fhir_risk_assessments = []
-
-        for prediction in predictions:
-            risk_ass.subject = {"reference": "Patient/" + prediction['patientId']}
-
-            # temporary mapping of output string to code with "_" - needs to be changed to proper concept
-            patient_prediction['outcome']['coding'][0]['code'] = outcomes[prediction['prediction']]
-            risk_ass.prediction = [patient_prediction]
-            fhir_risk_assessments.append(risk_ass.as_json())
-            resp = requests.post(config.HAPIFHIR_URL + 'gtfhir/base/RiskAssessment', json=risk_ass.as_json())
-
-        return fhir_risk_assessments, 200
+
+        e = PredictionExportUtil.submit(ml_model.id, cohort_id=args['cohortId'])
+        location = url_for('model_prediction_export', model_id=ml_model.id, export_id=e.id, _external=True)
+
+        return get_prediction_export_manifest(e), 202, {'Content-Location': location}
+
+
+class MLModelPredictionExportResource(Resource):
+    def __init__(self):
+        super(MLModelPredictionExportResource, self).__init__()
+
+    @auth.login_required
+    @swagger.doc({
+        "summary": "Returns the status and the files of a bulk export",
+        "tags": ["ml models"],
+        "produces": [
+            "application/json"
+        ],
+        "description": 'Lists the finished NDJSON files of the export, files can be downloaded while the export is still running',
+        "parameters": [
+            {
+                "name": "model_id",
+                "in": "path",
+                "type": "integer",
+                "description": "The ID of the ML model",
+                "required": True
+            },
+            {
+                "name": "export_id",
+                "in": "path",
+                "type": "string",
+                "description": "The ID of the export",
+                "required": True
+            }
+        ],
+        "responses": {
+            "200": {
+                "description": "The export is finished or failed"
+            },
+            "202": {
+                "description": "The export is still running, the X-Progress header holds the number of finished files"
+            },
+            "404": {
+                "description": "Not found error when ML model or export doesn't exist"
+            }
+        }
+    })
+    def get(self, model_id, export_id):
+        e = PredictionExport.get(export_id, model_id=model_id)
+
+        if not PredictionExport.is_done(e):
+            return get_prediction_export_manifest(e), 202, {'X-Progress': '{} files written'.format(len(e.files or []))}
+
+        return get_prediction_export_manifest(e), 200
+
+    @auth.login_required
+    @swagger.doc({
+        "summary": "Deletes a bulk export and its files",
+        "tags": ["ml models"],
+        "produces": [
+            "application/json"
+        ],
+        "parameters": [
+            {
+                "name": "model_id",
+                "in": "path",
+                "type": "integer",
+                "description": "The ID of the ML model",
+                "required": True
+            },
+            {
+                "name": "export_id",
+                "in": "path",
+                "type": "string",
+                "description": "The ID of the export",
+                "required": True
+            }
+        ],
+        "responses": {
+            "200": {
+                "description": "Success: Returns the given ID"
+            },
+            "404": {
+                "description": "Not found error when ML model or export doesn't exist"
+            },
+            "409": {
+                "description": "The export is still running"
+            }
+        }
+    })
+    def delete(self, model_id, export_id):
+        e = PredictionExport.get(export_id, model_id=model_id)
+
+        if not PredictionExport.is_done(e):
+            abort(409, message="prediction export {} is still running".format(export_id))
+
+        PredictionExportUtil.remove(e)
+
+        return {'id': export_id}, 200
+
+
+class MLModelPredictionExportFileResource(Resource):
+    def __init__(self):
+        super(MLModelPredictionExportFileResource, self).__init__()
+
+    @auth.login_required
+    @swagger.doc({
+        "summary": "Downloads one NDJSON file of a bulk export",
+        "tags": ["ml models"],
+        "produces": [
+            "application/fhir+ndjson"
+        ],
+        "parameters": [
+            {
+                "name": "model_id",
+                "in": "path",
+                "type": "integer",
+                "description": "The ID of the ML model",
+                "required": True
+            },
+            {
+                "name": "export_id",
+                "in": "path",
+                "type": "string",
+                "description": "The ID of the export",
+                "required": True
+            },
+            {
+                "name": "file_number",
+                "in": "path",
+                "type": "integer",
+                "description": "The number of the file, starting at 1",
+                "required": True
+            }
+        ],
+        "responses": {
+            "200": {
+                "description": "Returns one FHIR resource per line"
+            },
+            "404": {
+                "description": "Not found error when ML model, export or file doesn't exist"
+            }
+        }
+    })
+    def get(self, model_id, export_id, file_number):
+        e = PredictionExport.get(export_id, model_id=model_id)
+
+        # only finished files are listed, the file being written is never served
+        if not 1 <= file_number <= len(e.files or []):
+            abort(404, message="prediction export {} has no file {}".format(export_id, file_number))
+
+        response = send_from_directory(PredictionExportUtil.get_export_path(e.id), PredictionExportUtil.get_file_name(file_number),
+                                       mimetype='application/fhir+ndjson')
+        response.status_code = 200
+        return response
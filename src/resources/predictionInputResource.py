@@ -0,0 +1,29 @@
+from flask import send_from_directory, request
+from flask_restful import abort
+from flask_restful_swagger_2 import Resource
+from util import featureCache as FeatureCache
+from util import authToken as AuthToken
+import re
+
+# set by the public nginx proxy, requests of the environment containers reach the api directly
+PROXY_HEADERS = ('X-Forwarded-For', 'X-Real-IP', 'Forwarded')
+
+
+class PredictionInputResource(Resource):
+    def __init__(self):
+        super(PredictionInputResource, self).__init__()
+
+    # environment containers have no user, they download their model input with the signed url they were given
+    def get(self, input_id):
+        if any(header in request.headers for header in PROXY_HEADERS):
+            abort(404, message="prediction input {} doesn't exist".format(input_id))
+
+        if not re.match('^[0-9a-f]{32}$', input_id):
+            abort(404, message="prediction input {} doesn't exist".format(input_id))
+
+        if not AuthToken.check_url_token(request.args.get('token', ''), input_id):
+            abort(403, message="missing, invalid or expired token for prediction input {}".format(input_id))
+
+        response = send_from_directory(FeatureCache.PREDICTION_INPUT_FOLDER, input_id + '.csv')
+        response.headers['content-type'] = 'text/csv'
+        return response
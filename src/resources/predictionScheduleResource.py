@@ -0,0 +1,314 @@
+from flask import g
+from flask_restful import reqparse, fields, marshal_with, marshal
+from flask_restful_swagger_2 import swagger, Resource
+import rdb.models.predictionSchedule as PredictionSchedule
+import rdb.models.predictionScheduleRun as PredictionScheduleRun
+import rdb.models.predictionWatermark as PredictionWatermark
+from rdb.models.id import ID, id_fields
+from resources.userResource import auth
+from flask_restplus import inputs
+import config
+
+
+prediction_schedule_fields = {
+    'id': fields.Integer,
+    'model_id': fields.Integer,
+    'cohort_id': fields.Integer,
+    'cron': fields.String,
+    'write_to_fhir': fields.Boolean,
+    'enabled': fields.Boolean,
+    'creator_id': fields.Integer,
+    'last_run_at': fields.DateTime,
+    'next_run_at': fields.DateTime,
+    'created_at': fields.DateTime,
+    'updated_at': fields.DateTime
+}
+
+prediction_schedule_run_fields = {
+    'id': fields.Integer,
+    'schedule_id': fields.Integer,
+    'status': fields.String,
+    'patients_total': fields.Integer,
+    'patients_scored': fields.Integer,
+    'patients_reused': fields.Integer,
+    'patients_unscored': fields.Integer,
+    'timings': fields.Raw,
+    'error': fields.String,
+    'started_at': fields.DateTime,
+    'finished_at': fields.DateTime
+}
+
+prediction_watermark_fields = {
+    'patient_id': fields.Integer,
+    'watermark': fields.DateTime,
+    'prediction': fields.Raw,
+    'updated_at': fields.DateTime
+}
+
+
+class PredictionScheduleListResource(Resource):
+    def __init__(self):
+        super(PredictionScheduleListResource, self).__init__()
+        self.parser = reqparse.RequestParser()
+        self.parser.add_argument('model_id', type=int, required=True, help='No model id provided', location='json')
+        self.parser.add_argument('cohort_id', type=int, required=True, help='No atlas cohort id provided', location='json')
+        self.parser.add_argument('cron', type=str, required=True, help='No cron expression provided', location='json')
+        self.parser.add_argument('write_to_fhir', type=inputs.boolean, required=False, location='json')
+
+    @auth.login_required
+    @swagger.doc({
+        "summary": "Returns the prediction schedules of the logged in user",
+        "tags": ["prediction schedules"],
+        "responses": {
+            "200": {
+                "description": "Returns the list of prediction schedules"
+            }
+        }
+    })
+    @marshal_with(prediction_schedule_fields)
+    def get(self):
+        return PredictionSchedule.get_all_for_user(g.user.id), 200
+
+    @auth.login_required
+    @swagger.doc({
+        "summary": "Schedule the repeated scoring of an Atlas cohort",
+        "tags": ["prediction schedules"],
+        "description": 'Every run scores only patients which are new in the cohort or got new data since the last run',
+        "parameters": [
+            {
+                "name": "body",
+                "in": "body",
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "model_id": {"type": "integer"},
+                        "cohort_id": {"type": "integer"},
+                        "cron": {"type": "string", "example": "0 2 * * *"},
+                        "write_to_fhir": {"type": "boolean"}
+                    }
+                },
+                "required": True
+            }
+        ],
+        "responses": {
+            "201": {
+                "description": "Returns the created prediction schedule"
+            },
+            "400": {
+                "description": "Invalid cron expression"
+            },
+            "404": {
+                "description": "Not found error when ML model doesn't exist"
+            }
+        }
+    })
+    @marshal_with(prediction_schedule_fields)
+    def post(self):
+        args = self.parser.parse_args()
+
+        s = PredictionSchedule.create(args['model_id'], args['cohort_id'], args['cron'], write_to_fhir=args['write_to_fhir'])
+
+        return s, 201
+
+
+class PredictionScheduleResource(Resource):
+    def __init__(self):
+        super(PredictionScheduleResource, self).__init__()
+        self.parser = reqparse.RequestParser()
+        self.parser.add_argument('cohort_id', type=int, required=False, location='json')
+        self.parser.add_argument('cron', type=str, required=False, location='json')
+        self.parser.add_argument('write_to_fhir', type=inputs.boolean, required=False, location='json')
+        self.parser.add_argument('enabled', type=inputs.boolean, required=False, location='json')
+
+    @auth.login_required
+    @swagger.doc({
+        "summary": "Returns a specific prediction schedule",
+        "tags": ["prediction schedules"],
+        "parameters": [
+            {
+                "name": "schedule_id",
+                "in": "path",
+                "type": "integer",
+                "description": "The ID of the prediction schedule",
+                "required": True
+            }
+        ],
+        "responses": {
+            "200": {
+                "description": "Returns the prediction schedule"
+            },
+            "404": {
+                "description": "Not found error when prediction schedule doesn't exist"
+            }
+        }
+    })
+    @marshal_with(prediction_schedule_fields)
+    def get(self, schedule_id):
+        return PredictionSchedule.get(schedule_id), 200
+
+    @auth.login_required
+    @swagger.doc({
+        "summary": "Update a prediction schedule",
+        "tags": ["prediction schedules"],
+        "parameters": [
+            {
+                "name": "schedule_id",
+                "in": "path",
+                "type": "integer",
+                "description": "The ID of the prediction schedule",
+                "required": True
+            },
+            {
+                "name": "body",
+                "in": "body",
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "cohort_id": {"type": "integer"},
+                        "cron": {"type": "string"},
+                        "write_to_fhir": {"type": "boolean"},
+                        "enabled": {"type": "boolean"}
+                    }
+                },
+                "required": True
+            }
+        ],
+        "responses": {
+            "200": {
+                "description": "Returns the updated prediction schedule"
+            },
+            "400": {
+                "description": "Invalid cron expression"
+            },
+            "404": {
+                "description": "Not found error when prediction schedule doesn't exist"
+            }
+        }
+    })
+    @marshal_with(prediction_schedule_fields)
+    def put(self, schedule_id):
+        args = self.parser.parse_args()
+
+        s = PredictionSchedule.update(schedule_id, cohort_id=args['cohort_id'], cron=args['cron'],
+                                      write_to_fhir=args['write_to_fhir'], enabled=args['enabled'])
+
+        return s, 200
+
+    @auth.login_required
+    @swagger.doc({
+        "summary": "Delete a prediction schedule with its runs and stored predictions",
+        "tags": ["prediction schedules"],
+        "parameters": [
+            {
+                "name": "schedule_id",
+                "in": "path",
+                "type": "integer",
+                "description": "The ID of the prediction schedule",
+                "required": True
+            }
+        ],
+        "responses": {
+            "200": {
+                "description": "Returns the ID of the deleted prediction schedule"
+            },
+            "404": {
+                "description": "Not found error when prediction schedule doesn't exist"
+            }
+        }
+    })
+    @marshal_with(id_fields)
+    def delete(self, schedule_id):
+        id = ID()
+        id.id = PredictionSchedule.delete(schedule_id)
+
+        return id, 200
+
+
+class PredictionScheduleRunListResource(Resource):
+    def __init__(self):
+        super(PredictionScheduleRunListResource, self).__init__()
+
+    @auth.login_required
+    @swagger.doc({
+        "summary": "Returns the runs of a prediction schedule, newest first",
+        "tags": ["prediction schedules"],
+        "parameters": [
+            {
+                "name": "schedule_id",
+                "in": "path",
+                "type": "integer",
+                "description": "The ID of the prediction schedule",
+                "required": True
+            }
+        ],
+        "responses": {
+            "200": {
+                "description": "Returns the runs with the number of scored, reused and unscored patients and their timings"
+            },
+            "404": {
+                "description": "Not found error when prediction schedule doesn't exist"
+            }
+        }
+    })
+    @marshal_with(prediction_schedule_run_fields)
+    def get(self, schedule_id):
+        s = PredictionSchedule.get(schedule_id)
+
+        return PredictionScheduleRun.get_all_for_schedule(s.id), 200
+
+
+class PredictionSchedulePredictionListResource(Resource):
+    def __init__(self):
+        super(PredictionSchedulePredictionListResource, self).__init__()
+        self.parser = reqparse.RequestParser()
+        self.parser.add_argument('after', type=int, required=False, location='args')
+        self.parser.add_argument('limit', type=int, default=100, required=False, location='args')
+
+    @auth.login_required
+    @swagger.doc({
+        "summary": "Returns the latest prediction of every patient scored by a prediction schedule",
+        "tags": ["prediction schedules"],
+        "description": 'Ordered by patient ID. Pass the returned next value as after to get the following page',
+        "parameters": [
+            {
+                "name": "schedule_id",
+                "in": "path",
+                "type": "integer",
+                "description": "The ID of the prediction schedule",
+                "required": True
+            },
+            {
+                "name": "after",
+                "in": "query",
+                "type": "integer",
+                "description": "Patient ID after which the page starts",
+                "required": False
+            },
+            {
+                "name": "limit",
+                "in": "query",
+                "type": "integer",
+                "description": "Maximum number of patients per page",
+                "required": False
+            }
+        ],
+        "responses": {
+            "200": {
+                "description": "Returns a page of stored predictions and the cursor of the next page"
+            },
+            "404": {
+                "description": "Not found error when prediction schedule doesn't exist"
+            }
+        }
+    })
+    def get(self, schedule_id):
+        args = self.parser.parse_args()
+        s = PredictionSchedule.get(schedule_id)
+        limit = min(max(args['limit'], 1), config.PREDICTION_RESULT_PAGE_LIMIT)
+
+        watermarks = PredictionWatermark.get_page(s.id, after=args['after'], limit=limit)
+        ret = {'schedule_id': s.id, 'results': marshal(watermarks, prediction_watermark_fields), 'next': None}
+        if len(watermarks) == limit:
+            ret['next'] = watermarks[-1].patient_id
+
+        return ret, 200
@@ -2,7 +2,7 @@ from flask import g
 from flask_restful import reqparse, fields, marshal_with
 from flask_restful_swagger_2 import swagger, Resource
 import rdb.models.user as User
-from rdb.models.user import auth
+from rdb.models.user import auth, basic_auth
 from rdb.models.id import ID, id_fields
 from resources.adminAccess import AdminAccess
 
@@ -16,15 +16,55 @@ user_fields = {
     'updated_at': fields.DateTime
 }
 
+user_login_fields = dict(user_fields, token=fields.String, token_expires_in=fields.Integer)
+
 
 class UserLoginResource(Resource):
     def __init__(self):
         super(UserLoginResource, self).__init__()
 
-    @auth.login_required
-    @marshal_with(user_fields)
+    # only credentials issue a token, a token renewing itself would outlive AUTH_TOKEN_TTL and survive the logout
+    @basic_auth.login_required
+    @marshal_with(user_login_fields)
+    @swagger.doc({
+        "summary": "Login and issue an auth token",
+        "tags": ["users"],
+        "produces": [
+            "application/json"
+        ],
+        "description": 'Returns the logged in user and a short-lived signed token, which can be sent as "Authorization: Bearer <token>" instead of basic auth credentials. Requires basic auth credentials, a token can not be used to get a new one',
+        "responses": {
+            "200": {
+                "description": "Returns the logged in user including the auth token"
+            }
+        }
+    })
     def get(self):
-        return g.user, 200
+        u = User.get(g.user.id)
+
+        login = {key: getattr(u, key) for key in user_fields}
+        login['token'], login['token_expires_in'] = User.generate_auth_token(u)
+
+        return login, 200
+
+    @auth.login_required
+    @swagger.doc({
+        "summary": "Logout and revoke auth tokens",
+        "tags": ["users"],
+        "produces": [
+            "application/json"
+        ],
+        "description": 'Revokes the auth token used for this request or, when called with basic auth credentials, all auth tokens of the user',
+        "responses": {
+            "200": {
+                "description": "Returns a success flag"
+            }
+        }
+    })
+    def delete(self):
+        User.revoke_auth_tokens(g.user.id)
+
+        return {'done': True}, 200
 
 
 user_post_parser = reqparse.RequestParser()
@@ -0,0 +1,88 @@
+"""SQL statements issued per authenticated request"""
+
+import base64
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+pytest.importorskip('flask_restful_swagger_2')
+
+
+@pytest.fixture(scope='module')
+def app():
+    from flask import Flask, g
+    from flask_restful_swagger_2 import Api, Resource
+    from rdb.rdb import db, create_all
+    import rdb.models.user as User
+
+    class WhoAmIResource(Resource):
+        @User.auth.login_required
+        def get(self):
+            return {'id': g.user.id, 'username': g.user.username}, 200
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.app = app
+    db.init_app(app)
+    Api(app).add_resource(WhoAmIResource, '/whoami')
+
+    with app.app_context():
+        create_all()
+        u = User.User()
+        u.username = 'alice'
+        u.email = 'alice@example.org'
+        u.hash_password('secret')
+        db.session.add(u)
+        db.session.commit()
+
+        yield app
+
+
+@pytest.fixture
+def statements(app):
+    from rdb.rdb import db
+    from sqlalchemy import event
+
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    yield executed
+    event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def basic_auth(username, password):
+    return {'Authorization': 'Basic ' + base64.b64encode('{}:{}'.format(username, password).encode('utf-8')).decode('ascii')}
+
+
+def test_basic_auth_loads_only_the_user(app, statements):
+    client = app.test_client()
+
+    # the second request is answered from the credential cache, but still loads the user
+    for _ in range(2):
+        del statements[:]
+        resp = client.get('/whoami', headers=basic_auth('alice', 'secret'))
+
+        assert resp.status_code == 200
+        assert len(statements) == 1
+        assert 'data_request' not in statements[0]
+
+
+def test_token_auth_does_not_load_the_user(app, statements):
+    import rdb.models.user as User
+
+    with app.test_request_context():
+        token, ttl = User.generate_auth_token(User.get_by_username('alice'))
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer ' + token}
+
+    # the first request loads the snapshot of revoked tokens, which is reused afterwards
+    assert client.get('/whoami', headers=headers).status_code == 200
+
+    del statements[:]
+    resp = client.get('/whoami', headers=headers)
+
+    assert resp.status_code == 200
+    assert statements == []
@@ -0,0 +1,68 @@
+from itsdangerous import URLSafeSerializer, BadSignature
+import config
+import os
+import time
+import uuid
+import logging
+logger = logging.getLogger(__name__)
+
+
+def get_secret_keys():
+    keys = [key.strip() for key in config.AUTH_TOKEN_SECRET_KEYS.split(',') if key.strip()]
+
+    if not keys:
+        # forked uwsgi workers share this key, but tokens do not survive a restart
+        logger.warning("no AUTH_TOKEN_SECRET_KEYS configured, using a random key for signing auth tokens")
+        keys = [os.urandom(32)]
+
+    return keys
+
+
+# itsdangerous signs with the last key and accepts signatures of all keys, which allows key rotation
+secret_keys = get_secret_keys()
+serializer = URLSafeSerializer(secret_keys, salt='ketos-auth-token')
+
+
+def generate_token(user, ttl=None):
+    if ttl is None:
+        ttl = config.AUTH_TOKEN_TTL
+
+    now = time.time()
+    payload = {
+        'id': user.id,
+        'username': user.username,
+        'jti': uuid.uuid4().hex,
+        'iat': now,
+        'exp': now + ttl
+    }
+
+    return serializer.dumps(payload), ttl
+
+
+def load_token(token):
+    try:
+        payload = serializer.loads(token)
+    except BadSignature:
+        return None
+
+    if payload.get('exp', 0) <= time.time():
+        return None
+
+    return payload
+
+
+# urls for the environment containers are signed with their own salt, so that they can not be used as auth tokens
+url_serializer = URLSafeSerializer(secret_keys, salt='ketos-url-token')
+
+
+def generate_url_token(subject, ttl):
+    return url_serializer.dumps({'sub': subject, 'exp': time.time() + ttl})
+
+
+def check_url_token(token, subject):
+    try:
+        payload = url_serializer.loads(token)
+    except BadSignature:
+        return False
+
+    return payload.get('sub') == subject and payload.get('exp', 0) > time.time()
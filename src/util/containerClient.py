@@ -0,0 +1,277 @@
+from requests.adapters import HTTPAdapter
+from werkzeug.exceptions import ServiceUnavailable
+from util import deadline as Deadline
+import requests
+import config
+import math
+import random
+import threading
+import time
+import logging
+logger = logging.getLogger(__name__)
+
+
+CONTAINER_API_PORT = 5000
+RETRY_STATUS_CODES = (502, 503, 504)
+
+# one keep-alive session per environment container, shared by all threads of this worker
+sessions = {}
+metrics = {}
+breakers = {}
+outstanding = {}
+lock = threading.Lock()
+
+
+class CircuitOpenError(ServiceUnavailable):
+    """Fast failure for a container whose circuit is open, answered with 503 and Retry-After"""
+
+    def __init__(self, container_name, retry_after):
+        # ServiceUnavailable sends the Retry-After header itself
+        super(CircuitOpenError, self).__init__(description="environment container {} is unavailable, retry in {} seconds".format(container_name, retry_after),
+                                               retry_after=retry_after)
+
+
+class CircuitBreaker(object):
+    """Opens after consecutive failed or slow calls and lets a single probe call through once the open time passed"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self):
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def before_call(self, container_name):
+        with self.lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return
+
+            waited = time.monotonic() - self.opened_at
+            if self.state == CircuitBreaker.OPEN and waited >= config.CIRCUIT_OPEN_SECONDS:
+                self.state = CircuitBreaker.HALF_OPEN
+
+            if self.state == CircuitBreaker.HALF_OPEN and not self.probing:
+                self.probing = True
+                return
+
+            retry_after = max(1, int(math.ceil(config.CIRCUIT_OPEN_SECONDS - waited)))
+
+        raise CircuitOpenError(container_name, retry_after)
+
+    def on_success(self):
+        with self.lock:
+            self.state = CircuitBreaker.CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def on_abandoned(self):
+        # neither a success nor a failure, only a probe call has to be allowed again
+        with self.lock:
+            self.probing = False
+
+    def on_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+
+            if self.state == CircuitBreaker.HALF_OPEN or self.failures >= config.CIRCUIT_FAILURE_THRESHOLD:
+                if self.state != CircuitBreaker.OPEN:
+                    logger.warning("opening circuit after {} failed calls".format(self.failures))
+                self.state = CircuitBreaker.OPEN
+                self.opened_at = time.monotonic()
+
+
+def get_breaker(container_name):
+    with lock:
+        breaker = breakers.get(container_name)
+
+        if breaker is None:
+            breaker = CircuitBreaker()
+            breakers[container_name] = breaker
+
+    return breaker
+
+
+def get_session(container_name):
+    with lock:
+        session = sessions.get(container_name)
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.CONTAINER_POOL_SIZE, max_retries=0)
+            session.mount('http://', adapter)
+            sessions[container_name] = session
+
+    return session
+
+
+def close_session(container_name):
+    with lock:
+        session = sessions.pop(container_name, None)
+        metrics.pop(container_name, None)
+        breakers.pop(container_name, None)
+        outstanding.pop(container_name, None)
+
+    if session is not None:
+        session.close()
+
+
+def get_url(container_name, path):
+    return 'http://' + container_name + ':' + str(CONTAINER_API_PORT) + path
+
+
+def record(container_name, latency, error=None, retry=False):
+    with lock:
+        m = metrics.setdefault(container_name, {'requests': 0, 'errors': 0, 'retries': 0, 'latency_total': 0.0, 'latency_max': 0.0, 'last_error': None})
+        m['requests'] += 1
+        m['latency_total'] += latency
+        m['latency_max'] = max(m['latency_max'], latency)
+
+        if retry:
+            m['retries'] += 1
+
+        if error is not None:
+            m['errors'] += 1
+            m['last_error'] = error
+
+
+def get_metrics():
+    with lock:
+        ret = []
+        for container_name, m in metrics.items():
+            cur = dict(m)
+            cur['container_name'] = container_name
+            cur['latency_avg'] = round(m['latency_total'] / m['requests'], 3) if m['requests'] else 0.0
+            cur['circuit'] = breakers[container_name].state if container_name in breakers else CircuitBreaker.CLOSED
+            cur['outstanding'] = outstanding.get(container_name, 0)
+            cur.pop('latency_total')
+            ret.append(cur)
+
+    return ret
+
+
+def is_available(container_name):
+    breaker = breakers.get(container_name)
+    if breaker is None or breaker.state == CircuitBreaker.CLOSED:
+        return True
+
+    return breaker.state == CircuitBreaker.OPEN and time.monotonic() - breaker.opened_at >= config.CIRCUIT_OPEN_SECONDS
+
+
+def choose(container_names):
+    """Pick the available replica with the fewest outstanding requests, ties are broken randomly"""
+
+    if len(container_names) == 1:
+        return container_names[0]
+
+    with lock:
+        available = [name for name in container_names if is_available(name)]
+        # with every circuit open the first container answers with the fast failure
+        if not available:
+            return container_names[0]
+
+        fewest = min(outstanding.get(name, 0) for name in available)
+
+        return random.choice([name for name in available if outstanding.get(name, 0) == fewest])
+
+
+def get_backoff(attempt):
+    # full jitter, so that retries of concurrent requests do not hit the container at the same time
+    return random.uniform(0, config.CONTAINER_RETRY_BACKOFF * (2 ** attempt))
+
+
+def send(session, container_name, method, url, **kwargs):
+    with lock:
+        outstanding[container_name] = outstanding.get(container_name, 0) + 1
+
+    try:
+        return session.request(method, url, **kwargs)
+    finally:
+        with lock:
+            outstanding[container_name] -= 1
+
+
+def request(method, container_name, path, retries=None, timeout=None, deadline=None, retry_read_timeout=True, **kwargs):
+    """Send a request to the api of an environment container using a pooled keep-alive connection
+
+    With retry_read_timeout=False only failures to connect are retried, a request which timed out while the container was
+    working on it is not sent again.
+    """
+
+    if retries is None:
+        # only idempotent requests are retried, a repeated POST could create a second model
+        retries = config.CONTAINER_RETRIES if method == 'GET' else 0
+
+    if timeout is None:
+        timeout = (config.CONTAINER_CONNECT_TIMEOUT, config.CONTAINER_READ_TIMEOUT)
+
+    if deadline is not None:
+        kwargs['headers'] = dict(kwargs.get('headers') or {}, **deadline.get_headers())
+
+    session = get_session(container_name)
+    breaker = get_breaker(container_name)
+    url = get_url(container_name, path)
+    attempt = 0
+
+    while True:
+        call_timeout = Deadline.get_timeout(deadline, *timeout)
+        breaker.before_call(container_name)
+        start = time.perf_counter()
+        try:
+            resp = send(session, container_name, method, url, timeout=call_timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if isinstance(e, requests.exceptions.Timeout) and Deadline.is_exceeded(deadline):
+                # the timeout was shortened to the deadline of the client, which says nothing about the container
+                breaker.on_abandoned()
+                record(container_name, time.perf_counter() - start)
+                raise Deadline.DeadlineExceeded()
+
+            breaker.on_failure()
+            retry = attempt < retries and (retry_read_timeout or not isinstance(e, requests.exceptions.ReadTimeout))
+            record(container_name, time.perf_counter() - start, error=str(e), retry=retry)
+            if not retry:
+                raise
+        except requests.exceptions.RequestException as e:
+            breaker.on_failure()
+            record(container_name, time.perf_counter() - start, error=str(e))
+            raise
+        else:
+            latency = time.perf_counter() - start
+            if resp.status_code >= 500:
+                breaker.on_failure()
+                retry = attempt < retries and resp.status_code in RETRY_STATUS_CODES
+                record(container_name, latency, error='HTTP ' + str(resp.status_code), retry=retry)
+                if not retry:
+                    return resp
+            else:
+                # a container answering this slowly is treated like a failing one
+                if config.CIRCUIT_SLOW_CALL_SECONDS > 0 and latency > config.CIRCUIT_SLOW_CALL_SECONDS:
+                    breaker.on_failure()
+                else:
+                    breaker.on_success()
+                record(container_name, latency)
+                return resp
+
+        backoff = get_backoff(attempt)
+        if deadline is not None and deadline.remaining() <= backoff:
+            raise Deadline.DeadlineExceeded()
+
+        logger.warning("retrying {} {} after failed attempt {}".format(method, url, attempt + 1))
+        time.sleep(backoff)
+        attempt += 1
+
+
+def get(container_name, path, **kwargs):
+    return request('GET', container_name, path, **kwargs)
+
+
+def post(container_name, path, **kwargs):
+    return request('POST', container_name, path, **kwargs)
+
+
+def get_balanced(container_names, path, **kwargs):
+    return get(choose(container_names), path, **kwargs)
@@ -0,0 +1,99 @@
+import rdb.models.crawlerJobCleanup as CrawlerJobCleanup
+from util import crawlerUtil as CrawlerUtil
+from util import workerThread as WorkerThread
+import config
+import queue
+import requests
+import time
+import logging
+logger = logging.getLogger(__name__)
+
+
+# crawler ids released by finished predictions, deleted from the crawler by the cleanup thread
+released = queue.Queue()
+
+
+def init():
+    WorkerThread.start_in_every_worker('crawler-cleanup', loop)
+
+
+def track(crawler_id):
+    """Remember a new crawler job, so that it is swept up even if the request crashes before releasing it"""
+
+    try:
+        CrawlerJobCleanup.track(crawler_id)
+    except Exception:
+        logger.warning("could not track crawler job {}: ".format(crawler_id), exc_info=True)
+
+
+def release(crawler_id):
+    released.put(crawler_id)
+
+
+def take_batch(timeout):
+    try:
+        batch = [released.get(timeout=timeout)]
+    except queue.Empty:
+        return []
+
+    while len(batch) < config.CRAWLER_CLEANUP_BATCH_SIZE:
+        try:
+            batch.append(released.get_nowait())
+        except queue.Empty:
+            break
+
+    return batch
+
+
+def delete_jobs(session, crawler_ids):
+    deleted = []
+    failed = []
+    error = None
+
+    for crawler_id in crawler_ids:
+        try:
+            resp = CrawlerUtil.delete_job(crawler_id, session=session)
+        except requests.exceptions.RequestException as e:
+            failed.append(crawler_id)
+            error = str(e)
+            continue
+
+        # a job which is gone already was deleted by another worker
+        if resp.status_code < 300 or resp.status_code == 404:
+            deleted.append(crawler_id)
+        else:
+            failed.append(crawler_id)
+            error = 'HTTP ' + str(resp.status_code)
+
+    CrawlerJobCleanup.remove(deleted)
+
+    given_up = CrawlerJobCleanup.record_failures(failed, error)
+    if failed:
+        logger.warning("could not delete {} crawler jobs, last error: {}".format(len(failed), error))
+    if given_up:
+        logger.error("gave up deleting {} crawler jobs".format(given_up))
+
+
+def sweep(session):
+    crawler_ids = CrawlerJobCleanup.get_due(config.CRAWLER_CLEANUP_SWEEP_LIMIT)
+
+    for start in range(0, len(crawler_ids), config.CRAWLER_CLEANUP_BATCH_SIZE):
+        delete_jobs(session, crawler_ids[start:start + config.CRAWLER_CLEANUP_BATCH_SIZE])
+
+
+def loop():
+    session = requests.Session()
+    next_sweep = time.monotonic()
+
+    while True:
+        try:
+            batch = take_batch(max(0.0, next_sweep - time.monotonic()))
+            if batch:
+                delete_jobs(session, batch)
+
+            if time.monotonic() >= next_sweep:
+                next_sweep = time.monotonic() + config.CRAWLER_CLEANUP_SWEEP_INTERVAL
+                sweep(session)
+        except Exception:
+            logger.error("Crawler job cleanup failed: ", exc_info=True)
+            time.sleep(1)
@@ -0,0 +1,176 @@
+from flask_restful import fields, marshal
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from rdb.models.feature import Feature
+import rdb.models.featureSet as FeatureSet
+from rdb.models.featureFeatureSet import FeatureFeatureSet
+from util.cache import TTLCache
+from util import deadline as Deadline
+import hashlib
+import json
+import requests
+import config
+
+
+feature_fields = {
+    'resource': fields.String,
+    'key': fields.String(attribute='parameter_name'),
+    'value': fields.String,
+    'name': fields.String,
+    'resource_val_path': fields.String(attribute='output_value_path')
+}
+
+
+def get_crawler_url(path):
+    return 'http://' + config.DATA_PREPROCESSING_HOST + path
+
+
+def get_feature_set_payload(features):
+    feature_set = []
+
+    for feature in features:
+        cur_feature = marshal(feature, feature_fields)
+
+        if cur_feature['resource_val_path'] is None:
+            cur_feature.pop('resource_val_path', None)
+
+        feature_set.append(cur_feature)
+
+    return feature_set
+
+
+class CompiledFeatureSet(object):
+    """Crawler feature set payload of a feature set, json encoded once and reused by every crawler request"""
+
+    def __init__(self, feature_set_id, payload):
+        self.feature_set_id = feature_set_id
+        self.payload = payload
+        self.encoded = json.dumps(payload, sort_keys=True).encode('utf-8')
+        self.fingerprint = hashlib.sha256(self.encoded).hexdigest()
+
+
+# other worker processes do not see the invalidation events, the ttl bounds how long they keep a stale payload
+compiled_feature_sets = TTLCache(maxsize=config.CRAWLER_PAYLOAD_CACHE_SIZE, ttl=config.CRAWLER_PAYLOAD_CACHE_TTL)
+
+
+def get_compiled_feature_set(feature_set_id):
+    compiled = compiled_feature_sets.get(feature_set_id)
+
+    if compiled is None:
+        feature_set = FeatureSet.get(feature_set_id)
+        compiled = CompiledFeatureSet(feature_set_id, get_feature_set_payload(feature_set.features))
+        compiled_feature_sets.set(feature_set_id, compiled)
+
+    return compiled
+
+
+def invalidate_compiled_feature_set(feature_set_id=None):
+    if feature_set_id is None:
+        compiled_feature_sets.clear()
+    else:
+        compiled_feature_sets.pop(feature_set_id)
+
+
+def mark_feature_set_changed(session, feature_set_id=None):
+    # invalidated after the commit, otherwise a concurrent request could compile the old state again
+    if session is not None:
+        session.info.setdefault('changed_feature_sets', set()).add(feature_set_id)
+
+
+@event.listens_for(FeatureSet.FeatureSet.features, 'append')
+@event.listens_for(FeatureSet.FeatureSet.features, 'remove')
+def feature_set_features_changed(target, value, initiator):
+    mark_feature_set_changed(object_session(target), target.id)
+
+
+@event.listens_for(FeatureSet.FeatureSet.features, 'bulk_replace')
+def feature_set_features_replaced(target, values, initiator):
+    mark_feature_set_changed(object_session(target), target.id)
+
+
+@event.listens_for(FeatureFeatureSet, 'after_insert')
+@event.listens_for(FeatureFeatureSet, 'after_delete')
+def feature_feature_set_changed(mapper, connection, target):
+    mark_feature_set_changed(object_session(target), target.feature_set_id)
+
+
+@event.listens_for(Feature, 'after_update')
+@event.listens_for(Feature, 'after_delete')
+def feature_changed(mapper, connection, target):
+    # a feature may be part of many feature sets, so all compiled feature sets are dropped
+    mark_feature_set_changed(object_session(target))
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_changed_feature_sets(session):
+    changed = session.info.pop('changed_feature_sets', None)
+    if not changed:
+        return
+
+    if None in changed:
+        invalidate_compiled_feature_set()
+    else:
+        for feature_set_id in changed:
+            invalidate_compiled_feature_set(feature_set_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_changed_feature_sets(session):
+    session.info.pop('changed_feature_sets', None)
+
+
+def encode_body(patient_key, patient_ids, compiled=None, **kwargs):
+    """Build the crawler request body around the already encoded feature set"""
+
+    body = dict(kwargs)
+    body[patient_key] = patient_ids
+    encoded = json.dumps(body).encode('utf-8')
+
+    if compiled is None:
+        return encoded
+
+    return encoded[:-1] + b', "feature_set": ' + compiled.encoded + b'}'
+
+
+def get_deadline_options(deadline):
+    """Pass the request deadline on to the crawler and stop waiting for it once the deadline passed"""
+
+    if deadline is None:
+        return {}
+
+    deadline.check()
+    return {'headers': deadline.get_headers(), 'timeout': deadline.remaining()}
+
+
+def post(path, body, deadline=None):
+    options = get_deadline_options(deadline)
+    headers = dict(options.pop('headers', {}), **{'Content-Type': 'application/json'})
+
+    with Deadline.raise_exceeded_on_timeout(deadline):
+        return requests.post(get_crawler_url(path), data=body, headers=headers, **options)
+
+
+def crawl(patient_ids, compiled, deadline=None):
+    return post('/crawler', encode_body('patient', patient_ids, compiled), deadline=deadline).json()
+
+
+def create_job(patient_ids, compiled=None, resource_name=None):
+    kwargs = {}
+    if resource_name is not None:
+        kwargs['resource'] = resource_name
+
+    return post('/crawler/jobs', encode_body('patient_ids', patient_ids, compiled, **kwargs)).json()
+
+
+def get_csv_url(crawler_response):
+    # the crawler reports its own host name, which is not reachable from the environment containers
+    return crawler_response['csv_url'].replace("localhost", "data_pre")
+
+
+def delete_job(crawler_id, session=None):
+    return (session or requests).delete(get_crawler_url('/crawler/jobs/' + crawler_id), timeout=config.CRAWLER_CLEANUP_TIMEOUT)
+
+
+def download_csv(crawler_response, deadline=None):
+    with Deadline.raise_exceeded_on_timeout(deadline):
+        return requests.get(get_csv_url(crawler_response), **get_deadline_options(deadline)).text
@@ -0,0 +1,65 @@
+import config
+import os
+import shutil
+import uuid
+import logging
+logger = logging.getLogger(__name__)
+
+
+# the data directory of an environment is mounted at this path in its containers
+CONTAINER_DATA_FOLDER = '/mlenvironment/models'
+HANDOFF_FOLDER = 'prediction_inputs'
+
+
+def is_enabled():
+    return config.PREDICTION_DATA_HANDOFF
+
+
+def get_path(data_directory, name):
+    return data_directory + '/' + HANDOFF_FOLDER + '/' + name + '.csv'
+
+
+def get_container_path(name):
+    return CONTAINER_DATA_FOLDER + '/' + HANDOFF_FOLDER + '/' + name + '.csv'
+
+
+def ensure_folder(data_directory):
+    folder = data_directory + '/' + HANDOFF_FOLDER
+    if not os.path.isdir(folder):
+        os.makedirs(folder, mode=0o777, exist_ok=True)
+
+
+def link(source_path, data_directory, name):
+    """Hand a file over to an environment, hard-linked if possible, and return the path seen by its containers"""
+
+    ensure_folder(data_directory)
+    path = get_path(data_directory, name)
+
+    try:
+        os.link(source_path, path)
+    except OSError:
+        # the data directory is on another file system
+        shutil.copyfile(source_path, path)
+
+    return get_container_path(name)
+
+
+def write(text, data_directory, name):
+    """Write model input into the data directory of an environment and return the path seen by its containers"""
+
+    ensure_folder(data_directory)
+    path = get_path(data_directory, name)
+    tmp_path = path + '.' + uuid.uuid4().hex + '.tmp'
+
+    with open(tmp_path, 'w', newline='') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+    return get_container_path(name)
+
+
+def remove(data_directory, name):
+    try:
+        os.remove(get_path(data_directory, name))
+    except OSError:
+        logger.warning("could not remove handed off prediction input {}".format(name))
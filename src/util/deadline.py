@@ -0,0 +1,87 @@
+from contextlib import contextmanager
+from flask import request
+from werkzeug.exceptions import GatewayTimeout
+import requests
+import config
+import time
+
+
+# absolute deadline as unix timestamp in seconds, passed on to the crawler and the environment containers
+DEADLINE_HEADER = 'X-Request-Deadline'
+
+
+class DeadlineExceeded(GatewayTimeout):
+    description = 'The deadline of the request passed before the prediction finished'
+
+
+class Deadline(object):
+    """Point in time after which work done for a request is wasted"""
+
+    def __init__(self, expires_at):
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds):
+        return cls(time.time() + seconds)
+
+    def remaining(self):
+        return self.expires_at - time.time()
+
+    def check(self):
+        if self.remaining() <= 0:
+            raise DeadlineExceeded()
+
+    def get_timeout(self, connect_timeout, read_timeout):
+        """Shrink the (connect, read) timeout to the time left, raises if nothing is left"""
+
+        self.check()
+        remaining = self.remaining()
+
+        return min(connect_timeout, remaining), min(read_timeout, remaining)
+
+    def get_headers(self):
+        return {DEADLINE_HEADER: '{:.3f}'.format(self.expires_at)}
+
+
+def from_request(use_default=True):
+    """Deadline sent by the client, otherwise the configured default unless it is disabled"""
+
+    value = request.headers.get(DEADLINE_HEADER)
+
+    if value:
+        try:
+            return Deadline(float(value))
+        except ValueError:
+            pass
+
+    if use_default and config.PREDICTION_DEADLINE > 0:
+        return Deadline.after(config.PREDICTION_DEADLINE)
+
+    return None
+
+
+def get_timeout(deadline, connect_timeout, read_timeout):
+    if deadline is None:
+        return connect_timeout, read_timeout
+
+    return deadline.get_timeout(connect_timeout, read_timeout)
+
+
+def get_headers(deadline):
+    return deadline.get_headers() if deadline is not None else {}
+
+
+def is_exceeded(deadline):
+    return deadline is not None and deadline.remaining() <= 0
+
+
+@contextmanager
+def raise_exceeded_on_timeout(deadline):
+    """Turn the timeout of a call which was cut short by the deadline into a 504"""
+
+    try:
+        yield
+    except requests.exceptions.Timeout:
+        if is_exceeded(deadline):
+            raise DeadlineExceeded()
+        raise
@@ -0,0 +1,116 @@
+from util.cache import TTLCache
+from util import authToken as AuthToken
+import config
+import csv
+import io
+import os
+import threading
+import time
+import uuid
+import logging
+logger = logging.getLogger(__name__)
+
+
+PREDICTION_INPUT_FOLDER = config.KETOS_DATA_FOLDER + '/prediction_inputs'
+
+# crawled feature rows per (feature set fingerprint, patient id, freshness window)
+rows = TTLCache(maxsize=config.FEATURE_CACHE_SIZE, ttl=config.FEATURE_CACHE_FRESHNESS)
+fingerprints_by_feature_set = {}
+fingerprints_lock = threading.Lock()
+
+
+def is_enabled():
+    return config.FEATURE_CACHE_SIZE > 0
+
+
+def get_window():
+    return int(time.time() // config.FEATURE_CACHE_FRESHNESS)
+
+
+def lookup(fingerprint, patient_ids):
+    """Returns the cached header, the cached rows by patient id and the ids of all patients missing in the cache"""
+
+    window = get_window()
+    header = None
+    cached = {}
+    missing = []
+
+    for patient_id in patient_ids:
+        entry = rows.get((fingerprint, str(patient_id), window))
+
+        if entry is None or (header is not None and entry[0] != header):
+            missing.append(patient_id)
+            continue
+
+        header = entry[0]
+        cached[str(patient_id)] = entry[1]
+
+    return header, cached, missing
+
+
+def store(feature_set_id, fingerprint, header, patient_rows):
+    with fingerprints_lock:
+        fingerprints_by_feature_set.setdefault(feature_set_id, set()).add(fingerprint)
+
+    window = get_window()
+    header = tuple(header)
+    for patient_id, row in patient_rows.items():
+        rows.set((fingerprint, patient_id, window), (header, row))
+
+
+def invalidate_feature_set(feature_set_id):
+    with fingerprints_lock:
+        fingerprints = fingerprints_by_feature_set.pop(feature_set_id, set())
+
+    if fingerprints:
+        rows.remove_if(lambda key, entry: key[0] in fingerprints)
+
+
+def parse_csv(text):
+    """Split a crawler csv into its header and the rows by patient id"""
+
+    reader = csv.reader(io.StringIO(text))
+    header = next(reader, None)
+
+    if not header or config.CRAWLER_CSV_PATIENT_COLUMN not in header:
+        logger.debug("crawler csv has no patient column {}, rows are not cached".format(config.CRAWLER_CSV_PATIENT_COLUMN))
+        return None, {}
+
+    patient_index = header.index(config.CRAWLER_CSV_PATIENT_COLUMN)
+    patient_rows = {}
+    for row in reader:
+        if len(row) > patient_index:
+            patient_rows[row[patient_index]] = tuple(row)
+
+    return tuple(header), patient_rows
+
+
+def write_input(header, ordered_rows):
+    """Write the assembled model input and return its id"""
+
+    if not os.path.isdir(PREDICTION_INPUT_FOLDER):
+        os.makedirs(PREDICTION_INPUT_FOLDER, mode=0o777, exist_ok=True)
+
+    input_id = str(uuid.uuid4().hex)
+    with open(get_input_path(input_id), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(ordered_rows)
+
+    return input_id
+
+
+def get_input_path(input_id):
+    return PREDICTION_INPUT_FOLDER + '/' + input_id + '.csv'
+
+
+def get_input_url(input_id):
+    token = AuthToken.generate_url_token(input_id, config.PREDICTION_INPUT_URL_TTL)
+    return config.KETOS_BRAIN_API_URL + '/prediction/inputs/' + input_id + '?token=' + token
+
+
+def delete_input(input_id):
+    try:
+        os.remove(get_input_path(input_id))
+    except OSError:
+        logger.warning("could not remove prediction input {}".format(input_id))
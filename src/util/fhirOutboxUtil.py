@@ -0,0 +1,53 @@
+import rdb.models.fhirOutbox as FhirOutbox
+from util import fhirUtil as FhirUtil
+from util import workerThread as WorkerThread
+import config
+import threading
+import time
+import logging
+logger = logging.getLogger(__name__)
+
+
+# set when this worker queued resources, so that they are written without waiting for the next poll
+wake = threading.Event()
+
+
+def is_enabled():
+    return config.FHIR_OUTBOX
+
+
+def init():
+    if not is_enabled():
+        return
+
+    WorkerThread.start_in_every_worker('fhir-outbox', loop)
+
+
+def enqueue(model_id, resources):
+    queued = FhirOutbox.enqueue(model_id, resources)
+    wake.set()
+
+    return queued
+
+
+def write(rows):
+    errors = FhirUtil.write([row.resource for row in rows])
+    failed = {error['index'] for error in errors}
+    FhirUtil.store_fingerprints([(row.model_id, row.resource) for i, row in enumerate(rows) if i not in failed and row.model_id is not None])
+
+    return errors
+
+
+def loop():
+    while True:
+        try:
+            handled = FhirOutbox.drain(write, config.FHIR_OUTBOX_BATCH_SIZE)
+        except Exception:
+            logger.error("Draining the FHIR outbox failed: ", exc_info=True)
+            handled = 0
+            time.sleep(1)
+
+        # a full batch means there is more to write right away
+        if handled < config.FHIR_OUTBOX_BATCH_SIZE:
+            wake.wait(config.FHIR_OUTBOX_POLL_INTERVAL)
+            wake.clear()
@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote
+import rdb.models.riskAssessmentFingerprint as RiskAssessmentFingerprint
+import requests
+import config
+import threading
+import time
+import logging
+logger = logging.getLogger(__name__)
+
+
+# bundles are posted concurrently, but never more at once than the fhir server is expected to handle
+executor = ThreadPoolExecutor(max_workers=config.FHIR_WRITE_WORKERS)
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_maxsize=config.FHIR_WRITE_WORKERS))
+session.mount('https://', HTTPAdapter(pool_maxsize=config.FHIR_WRITE_WORKERS))
+
+# totals of this worker since it started, the sync, cohort and streamed predictions do not return their own counts
+COUNTERS = ('written', 'failed', 'skipped', 'unmapped', 'queued')
+counters = dict.fromkeys(COUNTERS, 0)
+lock = threading.Lock()
+
+
+def get_base_url():
+    return config.HAPIFHIR_URL + 'gtfhir/base'
+
+
+def get_request(resource):
+    identifier = resource.get('identifier')
+    if not isinstance(identifier, dict):
+        return {'method': 'POST', 'url': resource['resourceType']}
+
+    # conditional update, creates the resource with the identifier once and replaces it afterwards instead of adding duplicates
+    search = quote('{}|{}'.format(identifier['system'], identifier['value']), safe='')
+    return {'method': 'PUT', 'url': '{}?identifier={}'.format(resource['resourceType'], search)}
+
+
+def count(stats):
+    with lock:
+        for key in COUNTERS:
+            counters[key] += stats.get(key, 0)
+
+
+def get_counters():
+    with lock:
+        return dict(counters)
+
+
+def create_bundle(bundle_type, resources):
+    return {
+        'resourceType': 'Bundle',
+        'type': bundle_type,
+        'entry': [{'resource': resource, 'request': get_request(resource)} for resource in resources]
+    }
+
+
+def post_bundle(bundle):
+    return session.post(get_base_url(), json=bundle, headers={'Content-Type': 'application/fhir+json'},
+                        timeout=(config.CONTAINER_CONNECT_TIMEOUT, config.FHIR_WRITE_TIMEOUT))
+
+
+def is_success(status):
+    return str(status).split(' ')[0].startswith('2')
+
+
+def write_chunk(resources):
+    """Write the resources in one transaction, if it is rejected find out which entries fail with a batch"""
+
+    try:
+        resp = post_bundle(create_bundle('transaction', resources))
+        if resp.status_code < 300:
+            return len(resources), []
+        logger.warning("FHIR transaction of {} resources failed with HTTP {}, retrying as batch".format(len(resources), resp.status_code))
+
+        resp = post_bundle(create_bundle('batch', resources))
+        resp.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        return 0, [{'index': i, 'error': str(e)} for i in range(len(resources))]
+
+    errors = []
+    for i, entry in enumerate(resp.json().get('entry', [])):
+        status = entry.get('response', {}).get('status', '')
+        if not is_success(status):
+            errors.append({'index': i, 'error': status, 'outcome': entry.get('response', {}).get('outcome')})
+
+    return len(resources) - len(errors), errors
+
+
+def write(resources, stats=None):
+    """Post the resources in bundles of FHIR_BUNDLE_SIZE and return the failed entries with their index in resources"""
+
+    if stats is None:
+        stats = {}
+
+    start = time.perf_counter()
+    size = max(config.FHIR_BUNDLE_SIZE, 1)
+    futures = [(offset, executor.submit(write_chunk, resources[offset:offset + size])) for offset in range(0, len(resources), size)]
+
+    written = 0
+    errors = []
+    for offset, future in futures:
+        chunk_written, chunk_errors = future.result()
+        written += chunk_written
+        for error in chunk_errors:
+            error['index'] += offset
+            errors.append(error)
+
+    duration = time.perf_counter() - start
+    stats.update({'bundles': len(futures), 'written': written, 'failed': len(errors), 'duration': round(duration, 3),
+                  'per_second': round(written / duration, 1) if duration > 0 else 0.0})
+
+    count({'written': written, 'failed': len(errors)})
+    logger.info("wrote {} FHIR resources in {} bundles within {:.3f} s ({} failed)".format(written, len(futures), duration, len(errors)))
+    if errors:
+        logger.warning("first failed FHIR entry: {}".format(errors[0]))
+
+    return errors
+
+
+def store_fingerprints(entries):
+    """Remember the written (model id, resource) entries, so that unchanged assessments are not written again"""
+
+    try:
+        RiskAssessmentFingerprint.store(entries)
+    except Exception:
+        logger.warning("could not store the fingerprints of {} written risk assessments: ".format(len(entries)), exc_info=True)
@@ -0,0 +1,132 @@
+from concurrent.futures import ThreadPoolExecutor
+from rdb.rdb import db
+import rdb.models.mlModel as MLModel
+import rdb.models.predictionExport as PredictionExport
+import rdb.models.predictionOutcome as PredictionOutcome
+import rdb.models.predictionResult as PredictionResult
+import rdb.util.omopDbConnection as OmopDbConnection
+from util import riskAssessmentTemplate as RiskAssessmentTemplate
+import config
+import json
+import os
+import shutil
+import logging
+logger = logging.getLogger(__name__)
+
+
+EXPORT_FOLDER = config.KETOS_DATA_FOLDER + '/exports'
+RESOURCE_TYPE = 'RiskAssessment'
+
+# exports read the rdb only and never call the fhir server, they run in the background like prediction jobs
+executor = ThreadPoolExecutor(max_workers=config.PREDICTION_EXPORT_WORKERS)
+
+
+def get_export_path(export_id):
+    return os.path.join(EXPORT_FOLDER, export_id)
+
+
+def get_file_name(number):
+    return '{}_{}.ndjson'.format(RESOURCE_TYPE, number)
+
+
+def submit(model_id, cohort_id=None):
+    e = PredictionExport.create(model_id, {'cohortId': cohort_id})
+
+    executor.submit(run, db.app, e.id)
+
+    return e
+
+
+def remove(e):
+    shutil.rmtree(get_export_path(e.id), ignore_errors=True)
+    PredictionExport.delete(e)
+
+
+def iter_results(model_id, cohort_id=None, omop_connection=None):
+    """Latest stored result of every patient of the model or cohort, read page by page in patient id order"""
+
+    page_size = config.PREDICTION_EXPORT_PAGE_SIZE
+    after = None
+
+    while True:
+        if cohort_id is None:
+            results = PredictionResult.get_latest(model_id, after=after, limit=page_size)
+            page = [r.patient_id for r in results]
+        else:
+            page = OmopDbConnection.get_patient_ids_for_atlas_cohort_page(cohort_id, after=after, limit=page_size, conn=omop_connection)
+            results = PredictionResult.get_latest(model_id, patient_ids=page, limit=page_size) if page else []
+
+        for result in results:
+            yield result
+
+        if len(page) < page_size:
+            return
+        after = page[-1]
+
+
+def render(template, result):
+    resource = template.render(result.patient_id, result.prediction.get('prediction'), result.prediction.get('probability'))
+    resource['date'] = result.created_at.isoformat()
+
+    return resource
+
+
+def write_file(e, number, resources, unmapped):
+    """Write a finished file under a temporary name first, so that downloads never see a partial file"""
+
+    path = os.path.join(get_export_path(e.id), get_file_name(number))
+    with open(path + '.part', 'w') as f:
+        for resource in resources:
+            f.write(json.dumps(resource) + '\n')
+    os.replace(path + '.part', path)
+
+    PredictionExport.add_file(e, RESOURCE_TYPE, len(resources), unmapped)
+
+
+def run(app, export_id):
+    with app.app_context():
+        e = PredictionExport.get(export_id, raise_abort=False)
+        if not e:
+            return
+
+        PredictionExport.set_running(e)
+        omop_connection = None
+        unmapped = 0
+
+        try:
+            ml_model = MLModel.get(e.model_id)
+            outcomes = PredictionOutcome.get_outcome_map(ml_model.id)
+            template = RiskAssessmentTemplate.get(ml_model.id, ml_model.condition_refcode, outcomes)
+
+            cohort_id = e.parameters.get('cohortId')
+            if cohort_id is not None:
+                omop_connection = OmopDbConnection.connect()
+                omop_connection.autocommit = True
+
+            os.makedirs(get_export_path(e.id), exist_ok=True)
+            resources = []
+            for result in iter_results(ml_model.id, cohort_id, omop_connection):
+                try:
+                    resources.append(render(template, result))
+                except KeyError:
+                    unmapped += 1
+                    continue
+
+                if len(resources) >= config.PREDICTION_EXPORT_FILE_SIZE:
+                    write_file(e, len(e.files) + 1, resources, unmapped)
+                    resources = []
+                    unmapped = 0
+
+            if resources:
+                write_file(e, len(e.files) + 1, resources, unmapped)
+                unmapped = 0
+        except Exception as ex:
+            logger.error("Prediction export {} failed: ".format(export_id), exc_info=True)
+            db.session.rollback()
+            PredictionExport.set_failed(e, str(ex))
+            return
+        finally:
+            if omop_connection is not None:
+                omop_connection.close()
+
+        PredictionExport.set_finished(e, unmapped)
@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor
+from rdb.rdb import db
+import rdb.models.mlModel as MLModel
+import rdb.models.predictionJob as PredictionJob
+from util import predictionUtil as PredictionUtil
+from util import deadline as Deadline
+import config
+import logging
+logger = logging.getLogger(__name__)
+
+
+# jobs run in the background, so that no request worker is blocked by a long running prediction
+executor = ThreadPoolExecutor(max_workers=config.PREDICTION_JOB_WORKERS)
+
+
+def submit(model_id, patient_ids, own_input_data=None, write_to_fhir=None, chunk_size=None, deadline=None):
+    parameters = {'patient_ids': patient_ids, 'ownInputData': own_input_data, 'writeToFhir': write_to_fhir, 'chunkSize': chunk_size,
+                  'deadline': deadline.expires_at if deadline is not None else None}
+    j = PredictionJob.create(model_id, parameters)
+
+    executor.submit(run, db.app, j.id)
+
+    return j
+
+
+def run(app, job_id):
+    with app.app_context():
+        j = PredictionJob.get(job_id, raise_abort=False)
+        if not j:
+            return
+
+        PredictionJob.set_running(j)
+        timings = {}
+
+        try:
+            ml_model = MLModel.get(j.model_id)
+            parameters = j.parameters
+            deadline = Deadline.Deadline(parameters['deadline']) if parameters.get('deadline') else None
+            result = PredictionUtil.run(ml_model, parameters['patient_ids'], own_input_data=parameters['ownInputData'],
+                                        write_to_fhir=parameters['writeToFhir'], chunk_size=parameters.get('chunkSize'), timings=timings,
+                                        deadline=deadline)
+        except Exception as e:
+            logger.error("Prediction job {} failed: ".format(job_id), exc_info=True)
+            db.session.rollback()
+            PredictionJob.set_failed(j, str(e), timings)
+            return
+
+        PredictionJob.set_finished(j, result, timings)
@@ -0,0 +1,129 @@
+from rdb.rdb import db
+import rdb.models.mlModel as MLModel
+import rdb.models.predictionSchedule as PredictionSchedule
+import rdb.models.predictionScheduleRun as PredictionScheduleRun
+import rdb.models.predictionWatermark as PredictionWatermark
+import rdb.util.omopDbConnection as OmopDbConnection
+from util import predictionUtil as PredictionUtil
+from util import workerThread as WorkerThread
+import config
+import datetime
+import time
+import logging
+logger = logging.getLogger(__name__)
+
+
+def init(app):
+    if config.PREDICTION_SCHEDULER_INTERVAL <= 0:
+        return
+
+    WorkerThread.start_in_every_worker('prediction-scheduler', loop, args=(app,))
+
+
+def loop(app):
+    while True:
+        time.sleep(config.PREDICTION_SCHEDULER_INTERVAL)
+
+        with app.app_context():
+            try:
+                run_due()
+            except Exception:
+                logger.error("Checking prediction schedules failed: ", exc_info=True)
+                db.session.rollback()
+
+
+def run_due():
+    now = datetime.datetime.now(datetime.timezone.utc)
+    schedule_ids = []
+
+    # moving next_run_at while holding the row locks claims the schedules for this worker
+    for s in PredictionSchedule.get_due_for_update(now):
+        s.last_run_at = now
+        s.set_next_run(now)
+        schedule_ids.append(s.id)
+
+    db.session.commit()
+
+    for schedule_id in schedule_ids:
+        run_schedule(schedule_id)
+
+
+def is_stale(watermark, data_watermark, scored_before):
+    """A patient is rescored if it is new, got newer data or was scored before the model last changed"""
+
+    if watermark is None:
+        return True
+
+    if data_watermark is not None and (watermark.watermark is None or watermark.watermark < data_watermark):
+        return True
+
+    return watermark.updated_at is None or watermark.updated_at < scored_before
+
+
+def run_schedule(schedule_id):
+    s = PredictionSchedule.get(schedule_id, raise_abort=False)
+    if not s:
+        return
+
+    r = PredictionScheduleRun.create(s.id)
+    timings = {'watermarks': 0.0, 'store': 0.0, 'fhir': 0.0}
+    counts = {'total': 0, 'scored': 0, 'reused': 0}
+    pending = {}
+
+    def iter_stale_patient_ids(omop_connection, scored_before):
+        for chunk in PredictionUtil.iter_chunks(OmopDbConnection.iter_patient_ids_for_atlas_cohort(s.cohort_id), config.PREDICTION_CHUNK_SIZE):
+            start = time.perf_counter()
+            data_watermarks = OmopDbConnection.get_data_watermarks(chunk, conn=omop_connection)
+            watermarks = PredictionWatermark.get_for_patients(s.id, chunk)
+            timings['watermarks'] += time.perf_counter() - start
+            counts['total'] += len(chunk)
+
+            for patient_id in chunk:
+                if is_stale(watermarks.get(patient_id), data_watermarks.get(patient_id), scored_before):
+                    pending[str(patient_id)] = (patient_id, data_watermarks.get(patient_id))
+                    yield patient_id
+                else:
+                    counts['reused'] += 1
+
+    error = None
+    omop_connection = None
+    try:
+        with PredictionUtil.timed(timings, 'total'):
+            ml_model = MLModel.get(s.model_id)
+            scored_before = max(ml_model.updated_at, ml_model.feature_set.updated_at) if ml_model.feature_set else ml_model.updated_at
+
+            omop_connection = OmopDbConnection.connect()
+            omop_connection.autocommit = True
+
+            for predictions in PredictionUtil.iter_chunk_predictions(ml_model, iter_stale_patient_ids(omop_connection, scored_before),
+                                                                     config.PREDICTION_CHUNK_SIZE, timings=timings):
+                start = time.perf_counter()
+                rows = []
+                for prediction in predictions['prediction']:
+                    patient_id, data_watermark = pending.pop(str(prediction['patientId']), (None, None))
+                    if patient_id is not None:
+                        rows.append((patient_id, data_watermark, prediction))
+
+                PredictionWatermark.upsert(s.id, rows)
+                counts['scored'] += len(rows)
+                timings['store'] += time.perf_counter() - start
+                PredictionUtil.store_results(s.model_id, predictions, timings)
+
+                # unchanged patients were written to FHIR by an earlier run already
+                if s.write_to_fhir and predictions['prediction']:
+                    start = time.perf_counter()
+                    PredictionUtil.predict_fhir_request(predictions, ml_model, timings)
+                    timings['fhir'] += time.perf_counter() - start
+    except Exception as e:
+        logger.error("Prediction schedule {} failed: ".format(schedule_id), exc_info=True)
+        db.session.rollback()
+        error = str(e)
+    finally:
+        if omop_connection is not None:
+            omop_connection.close()
+
+    for name in ('watermarks', 'store', 'fhir'):
+        timings[name] = round(timings[name], 3)
+
+    # stale patients still pending got no crawler or prediction row back, they keep their old prediction but were not reused
+    return PredictionScheduleRun.finish(r, counts['total'], counts['scored'], counts['reused'], len(pending), timings, error=error)
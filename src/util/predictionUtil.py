@@ -0,0 +1,556 @@
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import rdb.models.predictionOutcome as PredictionOutcome
+import rdb.models.predictionResult as PredictionResult
+import rdb.models.riskAssessmentFingerprint as RiskAssessmentFingerprint
+from util import crawlerUtil as CrawlerUtil
+from util import featureCache as FeatureCache
+from util import containerClient as ContainerClient
+from util import dataHandoff as DataHandoff
+from util import crawlerCleanup as CrawlerCleanup
+from util import fhirUtil as FhirUtil
+from util import fhirOutboxUtil as FhirOutboxUtil
+from util import riskAssessmentTemplate as RiskAssessmentTemplate
+from util.singleFlight import SingleFlight
+from util import deadline as Deadline
+from requests.exceptions import Timeout
+from werkzeug.exceptions import GatewayTimeout
+import config
+import hashlib
+import json
+import time
+import logging
+logger = logging.getLogger(__name__)
+
+
+# shared pools, so that the load on the crawler and the environments stays bounded across requests
+crawl_executor = ThreadPoolExecutor(max_workers=config.PREDICTION_CRAWL_WORKERS)
+score_executor = ThreadPoolExecutor(max_workers=config.PREDICTION_SCORE_WORKERS)
+
+# identical predictions from several dashboards share one crawl and container execution
+single_flight = SingleFlight(memo_size=config.PREDICTION_MEMO_SIZE, memo_ttl=config.PREDICTION_MEMO_TTL)
+
+
+@contextmanager
+def timed(timings, name):
+    """Record the duration of the enclosed block in seconds"""
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - start, 3)
+
+
+def get_execute_call(ml_model):
+    e = ml_model.environment
+
+    return e.get_container_names(), '/models/' + ml_model.ml_model_name + '/execute', e.get_data_directory()
+
+
+def execute(docker_api_call, data_url, deadline=None):
+    container_names, path, data_directory = docker_api_call
+
+    # the replica is chosen when the call is made, so that it reflects the current load
+    # a timed out execution is not retried, every attempt would score all patients again for up to the full read timeout
+    return ContainerClient.get_balanced(container_names, path, params=data_url, deadline=deadline, retry_read_timeout=False).json()
+
+
+class PredictionInput(object):
+    """Model input for a list of patients, either a crawler csv or a csv assembled from cached feature rows"""
+
+    def __init__(self, crawler_response=None, input_id=None, cache_rows=False):
+        self.crawler_response = crawler_response
+        self.input_id = input_id
+        self.cache_rows = cache_rows
+        # data directory of each environment the input was handed over to
+        self.handoffs = []
+
+    def get_data_url(self):
+        if self.input_id:
+            return FeatureCache.get_input_url(self.input_id)
+
+        return CrawlerUtil.get_csv_url(self.crawler_response)
+
+    def get_data_params(self, data_directory, crawl_spec):
+        """Query parameters telling the container where to read the model input from"""
+
+        if not DataHandoff.is_enabled():
+            return {'dataUrl': self.get_data_url()}
+
+        return {'dataPath': self.handoff(data_directory, crawl_spec)}
+
+    def get_name(self):
+        return self.input_id or self.crawler_response['crawler_id']
+
+    def handoff(self, data_directory, crawl_spec):
+        """Place the input into the data directory of the environment, which the containers read without an http transfer"""
+
+        name = self.get_name()
+
+        if data_directory in self.handoffs:
+            return DataHandoff.get_container_path(name)
+
+        if self.input_id:
+            source_path = FeatureCache.get_input_path(self.input_id)
+        elif self.handoffs:
+            source_path = DataHandoff.get_path(self.handoffs[0], name)
+        else:
+            source_path = None
+
+        if source_path is not None:
+            container_path = DataHandoff.link(source_path, data_directory, name)
+        else:
+            text = CrawlerUtil.download_csv(self.crawler_response, deadline=crawl_spec.get('deadline'))
+            container_path = DataHandoff.write(text, data_directory, name)
+
+            # the csv is at hand now, so the rows are cached without downloading them a second time on release
+            if self.cache_rows:
+                self.cache_rows = False
+                self.store_rows(crawl_spec, text)
+
+        self.handoffs.append(data_directory)
+
+        return container_path
+
+    def store_rows(self, crawl_spec, text=None):
+        try:
+            if text is None:
+                text = CrawlerUtil.download_csv(self.crawler_response, deadline=Deadline.Deadline.after(config.FEATURE_CACHE_DOWNLOAD_TIMEOUT))
+
+            header, patient_rows = FeatureCache.parse_csv(text)
+            if header:
+                FeatureCache.store(crawl_spec['feature_set_id'], crawl_spec['fingerprint'], header, patient_rows)
+        except Exception:
+            logger.warning("could not cache crawled feature rows: ", exc_info=True)
+
+    def release_crawler_job(self):
+        # the crawler job is deleted in the background, which keeps the round trip out of the response time
+        if self.crawler_response:
+            CrawlerCleanup.release(self.crawler_response['crawler_id'])
+
+    def store_rows_and_release(self, crawl_spec):
+        try:
+            self.store_rows(crawl_spec)
+        finally:
+            self.release_crawler_job()
+
+    def release(self, crawl_spec):
+        for data_directory in self.handoffs:
+            DataHandoff.remove(data_directory, self.get_name())
+
+        # the rows are downloaded again off the response path, the crawler job is released once they are cached
+        if self.cache_rows:
+            self.cache_rows = False
+            crawl_executor.submit(self.store_rows_and_release, crawl_spec)
+        else:
+            self.release_crawler_job()
+
+        if self.input_id:
+            FeatureCache.delete_input(self.input_id)
+
+
+def get_crawl_spec(ml_model, deadline=None):
+    compiled = CrawlerUtil.get_compiled_feature_set(ml_model.feature_set_id)
+
+    return {'feature_set_id': ml_model.feature_set_id, 'feature_set': compiled, 'fingerprint': compiled.fingerprint, 'deadline': deadline}
+
+
+def crawl(patient_ids, crawl_spec):
+    resp = CrawlerUtil.crawl(patient_ids, crawl_spec['feature_set'], deadline=crawl_spec.get('deadline'))
+    CrawlerCleanup.track(resp['crawler_id'])
+
+    return resp
+
+
+def prepare_input(crawl_spec, patient_ids, timings):
+    """Crawl the patients missing in the feature cache and assemble the model input"""
+
+    deadline = crawl_spec.get('deadline')
+
+    if not FeatureCache.is_enabled():
+        with timed(timings, 'crawl'):
+            resp = crawl(patient_ids, crawl_spec)
+        return PredictionInput(crawler_response=resp)
+
+    header, cached, missing = FeatureCache.lookup(crawl_spec['fingerprint'], patient_ids)
+    timings['cached_patients'] = len(cached)
+
+    if not cached:
+        with timed(timings, 'crawl'):
+            resp = crawl(patient_ids, crawl_spec)
+        return PredictionInput(crawler_response=resp, cache_rows=True)
+
+    fresh = {}
+    if missing:
+        with timed(timings, 'crawl'):
+            resp = crawl(missing, crawl_spec)
+            try:
+                fresh_header, fresh = FeatureCache.parse_csv(CrawlerUtil.download_csv(resp, deadline=deadline))
+            finally:
+                CrawlerCleanup.release(resp['crawler_id'])
+
+        if fresh_header != header:
+            # the cached rows do not fit the crawled columns, so crawl all patients again
+            FeatureCache.invalidate_feature_set(crawl_spec['feature_set_id'])
+            with timed(timings, 'crawl'):
+                resp = crawl(patient_ids, crawl_spec)
+            return PredictionInput(crawler_response=resp, cache_rows=True)
+
+        FeatureCache.store(crawl_spec['feature_set_id'], crawl_spec['fingerprint'], fresh_header, fresh)
+
+    ordered_rows = []
+    for patient_id in patient_ids:
+        row = cached.get(str(patient_id)) or fresh.get(str(patient_id))
+        if row:
+            ordered_rows.append(row)
+
+    return PredictionInput(input_id=FeatureCache.write_input(header, ordered_rows))
+
+
+def score(docker_api_call, prediction_input, crawl_spec, timings):
+    try:
+        with timed(timings, 'handoff'):
+            data_url = prediction_input.get_data_params(docker_api_call[2], crawl_spec)
+
+        with timed(timings, 'execute'):
+            predictions = execute(docker_api_call, data_url, deadline=crawl_spec.get('deadline'))
+    finally:
+        with timed(timings, 'crawler_cleanup'):
+            prediction_input.release(crawl_spec)
+
+    return predictions
+
+
+def iter_chunks(patient_ids, chunk_size):
+    chunk = []
+
+    for patient_id in patient_ids:
+        chunk.append(patient_id)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def score_chunk(docker_api_call, prediction_input, crawl_spec, chunk_timings):
+    return score(docker_api_call, prediction_input, crawl_spec, chunk_timings), chunk_timings
+
+
+def crawl_chunk(docker_api_call, chunk, crawl_spec):
+    chunk_timings = {'size': len(chunk)}
+    prediction_input = prepare_input(crawl_spec, chunk, chunk_timings)
+
+    # hand the chunk over to scoring right away, which frees this worker for crawling the next chunk
+    return score_executor.submit(score_chunk, docker_api_call, prediction_input, crawl_spec, chunk_timings)
+
+
+def iter_chunk_predictions(ml_model, patient_ids, chunk_size, timings=None, deadline=None):
+    """Crawl and score the patients chunk by chunk and yield the predictions of each chunk in patient order"""
+
+    if timings is None:
+        timings = {}
+
+    docker_api_call = get_execute_call(ml_model)
+    crawl_spec = get_crawl_spec(ml_model, deadline)
+    max_in_flight = config.PREDICTION_CRAWL_WORKERS + config.PREDICTION_SCORE_WORKERS
+    chunk_timings = timings.setdefault('chunks', [])
+    pending = deque()
+
+    def next_result():
+        predictions, cur_timings = pending.popleft().result().result()
+        chunk_timings.append(cur_timings)
+        return predictions
+
+    try:
+        for chunk in iter_chunks(patient_ids, chunk_size):
+            # no further chunks are started once the caller stopped waiting
+            if deadline is not None:
+                deadline.check()
+
+            pending.append(crawl_executor.submit(crawl_chunk, docker_api_call, chunk, crawl_spec))
+
+            while len(pending) >= max_in_flight:
+                yield next_result()
+
+        while pending:
+            yield next_result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def merge_predictions(chunk_predictions):
+    merged = None
+
+    for predictions in chunk_predictions:
+        if merged is None:
+            merged = dict(predictions)
+            merged['prediction'] = list(predictions['prediction'])
+        else:
+            merged['prediction'].extend(predictions['prediction'])
+
+    if merged is None:
+        merged = {'prediction': []}
+
+    return merged
+
+
+def predict(ml_model, patient_ids, own_input_data=None, chunk_size=None, timings=None, deadline=None):
+    """Crawl the model's features for the given patients and score them in the model's environment"""
+
+    if timings is None:
+        timings = {}
+
+    docker_api_call = get_execute_call(ml_model)
+
+    if chunk_size is None:
+        chunk_size = config.PREDICTION_CHUNK_SIZE
+
+    if own_input_data is False and 0 < chunk_size < len(patient_ids):
+        with timed(timings, 'chunked_prediction'):
+            predictions = merge_predictions(iter_chunk_predictions(ml_model, patient_ids, chunk_size, timings=timings, deadline=deadline))
+    elif own_input_data is False:
+        crawl_spec = get_crawl_spec(ml_model, deadline)
+        prediction_input = prepare_input(crawl_spec, patient_ids, timings)
+        predictions = score(docker_api_call, prediction_input, crawl_spec, timings)
+    else:
+        data_url = {'dataUrl': ""}
+
+        with timed(timings, 'execute'):
+            predictions = execute(docker_api_call, data_url, deadline=deadline)
+
+    return predictions
+
+
+def store_results(model_id, predictions, timings):
+    """Keep the predictions in the rdb, a failure does not fail the prediction"""
+
+    if not config.PREDICTION_RESULT_STORE:
+        return
+
+    start = time.perf_counter()
+    try:
+        PredictionResult.store(model_id, predictions['prediction'])
+    except Exception:
+        logger.warning("could not store predictions of model {}: ".format(model_id), exc_info=True)
+
+    timings['store_results'] = round(timings.get('store_results', 0.0) + time.perf_counter() - start, 3)
+
+
+def add_fhir_stats(timings, stats):
+    total = timings.setdefault('fhir_stats', {})
+
+    for key, value in stats.items():
+        if key != 'per_second':
+            total[key] = round(total.get(key, 0) + value, 3)
+
+    if 'written' in total:
+        total['per_second'] = round(total['written'] / total['duration'], 1) if total['duration'] > 0 else 0.0
+
+
+def get_changed_risk_assessments(model_id, risk_assessments):
+    try:
+        return RiskAssessmentFingerprint.get_changed(model_id, risk_assessments)
+    except Exception:
+        # writing everything again is safe, the conditional update replaces the earlier assessments
+        logger.warning("could not compare risk assessments of model {} with the written ones: ".format(model_id), exc_info=True)
+        return risk_assessments
+
+
+def predict_fhir_request(predictions, ml_model, timings=None):
+    # temporary mapping of output string to code with "_" - needs to be changed to proper concept
+    outcomes = PredictionOutcome.get_outcome_map(ml_model.id)
+    template = RiskAssessmentTemplate.get(ml_model.id, ml_model.condition_refcode, outcomes)
+    fhir_risk_assessments = []
+    results = []
+
+    for prediction in predictions['prediction']:
+        try:
+            risk_assessment = template.render(prediction['patientId'], prediction['prediction'], prediction.get('probability'))
+        except KeyError:
+            # one patient with an unmapped outcome does not stop the write back of the others
+            results.append({'patientId': prediction.get('patientId'), 'prediction': prediction.get('prediction'),
+                            'error': "model {} has no outcome code for the value {}".format(ml_model.id, prediction.get('prediction'))})
+            continue
+
+        fhir_risk_assessments.append(risk_assessment)
+        results.append(risk_assessment)
+
+    stats = {'unmapped': len(results) - len(fhir_risk_assessments)}
+    if config.FHIR_WRITE_CHANGED_ONLY:
+        assessments = len(fhir_risk_assessments)
+        fhir_risk_assessments = get_changed_risk_assessments(ml_model.id, fhir_risk_assessments)
+        stats['skipped'] = assessments - len(fhir_risk_assessments)
+        logger.info("skipped {} of {} unchanged risk assessments of model {}".format(stats['skipped'], assessments, ml_model.id))
+
+    if FhirOutboxUtil.is_enabled():
+        # the response only waits until the assessments are stored, the outbox writes them to FHIR and retries failures
+        start = time.perf_counter()
+        stats['queued'] = FhirOutboxUtil.enqueue(ml_model.id, fhir_risk_assessments)
+        stats['queue_duration'] = time.perf_counter() - start
+    else:
+        # written in bundles instead of one request per patient
+        errors = FhirUtil.write(fhir_risk_assessments, stats)
+        failed = {error['index'] for error in errors}
+        FhirUtil.store_fingerprints([(ml_model.id, resource) for i, resource in enumerate(fhir_risk_assessments) if i not in failed])
+
+    # written and failed are counted by the write itself, which the outbox uses as well
+    FhirUtil.count({key: stats[key] for key in ('skipped', 'unmapped', 'queued') if key in stats})
+
+    if timings is not None:
+        add_fhir_stats(timings, stats)
+
+    return results
+
+
+def iter_predictions(ml_model, patient_ids, own_input_data=None, write_to_fhir=None, chunk_size=None, timings=None, deadline=None):
+    """Yield single predictions (or risk assessments when writing to FHIR) as soon as their chunk is scored"""
+
+    if timings is None:
+        timings = {}
+
+    if chunk_size is None:
+        chunk_size = config.PREDICTION_CHUNK_SIZE
+
+    if own_input_data is False and chunk_size > 0:
+        chunk_predictions = iter_chunk_predictions(ml_model, patient_ids, chunk_size, timings=timings, deadline=deadline)
+    else:
+        chunk_predictions = iter([predict(ml_model, patient_ids, own_input_data=own_input_data, chunk_size=chunk_size, timings=timings, deadline=deadline)])
+
+    for predictions in chunk_predictions:
+        store_results(ml_model.id, predictions, timings)
+
+        if write_to_fhir is not False:
+            items = predict_fhir_request(predictions, ml_model, timings)
+        else:
+            items = predictions['prediction']
+
+        for item in items:
+            yield item
+
+
+def get_request_key(ml_model, patient_ids, **options):
+    # the model artifact changes with a new model name, environment or update of the model
+    artifact_version = (ml_model.ml_model_name, ml_model.environment.container_name, str(ml_model.updated_at))
+    patients_hash = hashlib.sha256(json.dumps(sorted(patient_ids)).encode('utf-8')).hexdigest()
+
+    return ml_model.id, artifact_version, patients_hash, json.dumps(options, sort_keys=True)
+
+
+def run(ml_model, patient_ids, own_input_data=None, write_to_fhir=None, chunk_size=None, timings=None, deadline=None):
+    """Run the whole prediction pipeline including the optional FHIR write back
+
+    Only requests without FHIR write back are coalesced and memoized, a request which writes to FHIR always runs and writes.
+    """
+
+    if timings is None:
+        timings = {}
+
+    def run_pipeline():
+        with timed(timings, 'pipeline'):
+            predictions = predict(ml_model, patient_ids, own_input_data=own_input_data, chunk_size=chunk_size, timings=timings, deadline=deadline)
+            store_results(ml_model.id, predictions, timings)
+
+            if write_to_fhir is not False:
+                with timed(timings, 'fhir_write'):
+                    predictions = predict_fhir_request(predictions, ml_model, timings)
+
+        return predictions
+
+    def retry(error):
+        # the deadline is not part of the key, so a follower with time left does not fail with the timeout of a leader
+        return isinstance(error, (GatewayTimeout, Timeout)) and (deadline is None or deadline.remaining() > 0)
+
+    key = get_request_key(ml_model, patient_ids, own_input_data=own_input_data, write_to_fhir=write_to_fhir, chunk_size=chunk_size)
+
+    with timed(timings, 'total'):
+        if write_to_fhir is not False:
+            predictions, shared = run_pipeline(), False
+        else:
+            try:
+                predictions, shared = single_flight.do(key, run_pipeline, timeout=deadline.remaining() if deadline is not None else None,
+                                                       retry=retry)
+            except TimeoutError:
+                raise Deadline.DeadlineExceeded()
+
+    timings['shared'] = shared
+
+    return predictions
+
+
+def score_models(calls, prediction_input, crawl_spec, timings):
+    """Score one model input with several models concurrently"""
+
+    results = {}
+
+    try:
+        with timed(timings, 'handoff'):
+            data_urls = [prediction_input.get_data_params(docker_api_call[2], crawl_spec) for model_id, docker_api_call in calls]
+
+        with timed(timings, 'execute'):
+            futures = [(model_id, score_executor.submit(execute, docker_api_call, data_url, crawl_spec.get('deadline')))
+                       for (model_id, docker_api_call), data_url in zip(calls, data_urls)]
+
+            for model_id, future in futures:
+                try:
+                    results[model_id] = {'model_id': model_id, 'predictions': future.result()}
+                except Exception as e:
+                    logger.error("Scoring model {} failed: ".format(model_id), exc_info=True)
+                    results[model_id] = {'model_id': model_id, 'error': str(e)}
+    finally:
+        with timed(timings, 'crawler_cleanup'):
+            prediction_input.release(crawl_spec)
+
+    return results
+
+
+def run_many(ml_models, patient_ids, write_to_fhir=None, timings=None, deadline=None):
+    """Crawl every distinct feature set of the models once and score the models sharing it from the same input"""
+
+    if timings is None:
+        timings = {}
+
+    groups = OrderedDict()
+    for ml_model in ml_models:
+        groups.setdefault(ml_model.feature_set_id, []).append(ml_model)
+
+    group_timings = timings.setdefault('feature_sets', [])
+    pending = []
+
+    with timed(timings, 'total'):
+        # all db access happens here, the workers only get plain values
+        for feature_set_id, models in groups.items():
+            crawl_spec = get_crawl_spec(models[0], deadline)
+            calls = [(m.id, get_execute_call(m)) for m in models]
+            cur_timings = {'feature_set_id': feature_set_id, 'model_ids': [m.id for m in models]}
+            group_timings.append(cur_timings)
+            pending.append((calls, crawl_spec, cur_timings, crawl_executor.submit(prepare_input, crawl_spec, patient_ids, cur_timings)))
+
+        results = {}
+        for calls, crawl_spec, cur_timings, input_future in pending:
+            try:
+                prediction_input = input_future.result()
+            except Exception as e:
+                logger.error("Crawling feature set {} failed: ".format(crawl_spec['feature_set_id']), exc_info=True)
+                for model_id, docker_api_call in calls:
+                    results[model_id] = {'model_id': model_id, 'error': str(e)}
+                continue
+
+            results.update(score_models(calls, prediction_input, crawl_spec, cur_timings))
+
+        for result in results.values():
+            if 'predictions' in result:
+                store_results(result['model_id'], result['predictions'], timings)
+
+        if write_to_fhir is not False:
+            ml_models_by_id = {m.id: m for m in ml_models}
+            with timed(timings, 'fhir_write'):
+                for result in results.values():
+                    if 'predictions' in result:
+                        result['predictions'] = predict_fhir_request(result['predictions'], ml_models_by_id[result['model_id']], timings)
+
+    return [results[m.id] for m in ml_models if m.id in results]
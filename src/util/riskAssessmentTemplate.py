@@ -0,0 +1,59 @@
+from util.cache import TTLCache
+import fhirclient.models.riskassessment as fhir_ra
+import rdb.fhir_models.riskAssessment as fhir_ra_base
+import config
+import copy
+
+# identifies the assessment of a patient by a model, so that a new prediction replaces the earlier assessment
+IDENTIFIER_SYSTEM = 'KETOS'
+
+
+class RiskAssessmentTemplate(object):
+    """RiskAssessment of a model, validated once with fhirclient, which is filled in per patient without fhirclient objects"""
+
+    def __init__(self, model_id, condition_reference, outcome_codes):
+        base = copy.deepcopy(fhir_ra_base.fhir__base_risk_assessment)
+        base['condition'] = {'reference': condition_reference}
+        base['prediction'] = [copy.deepcopy(fhir_ra_base.fhir_base_patient_prediction)]
+
+        # fails here, once per model, if the template is no valid RiskAssessment
+        compiled = fhir_ra.RiskAssessment(base).as_json()
+
+        prediction = compiled.pop('prediction')[0]
+        compiled.pop('subject', None)
+        self.outcome_coding = prediction.pop('outcome')['coding'][0]
+        self.probability = prediction.pop('probabilityDecimal', None)
+
+        # constant parts, never modified after this point
+        self.resource = compiled
+        self.prediction = prediction
+        self.outcome_codes = dict(outcome_codes)
+        self.model_id = model_id
+
+    def render(self, patient_id, outcome_value, probability=None):
+        """RiskAssessment of one patient, raises KeyError for an outcome without a code"""
+
+        outcome = dict(self.outcome_coding, code=self.outcome_codes[outcome_value])
+        prediction = dict(self.prediction, outcome={'coding': [outcome]})
+        prediction['probabilityDecimal'] = probability if probability is not None else self.probability
+
+        resource = dict(self.resource, subject={'reference': 'Patient/' + str(patient_id)})
+        resource['identifier'] = {'system': IDENTIFIER_SYSTEM, 'value': 'model_{}_patient_{}'.format(self.model_id, patient_id)}
+        resource['prediction'] = [prediction]
+
+        return resource
+
+
+# rendered assessments share the constant parts of their template, which is why templates are immutable
+templates = TTLCache(maxsize=config.TEMPLATE_CACHE_SIZE, ttl=config.TEMPLATE_CACHE_TTL)
+
+
+def get(model_id, condition_reference, outcome_codes):
+    key = (model_id, condition_reference, tuple(sorted(outcome_codes.items())))
+    template = templates.get(key)
+
+    if template is None:
+        template = RiskAssessmentTemplate(model_id, condition_reference, outcome_codes)
+        templates.set(key, template)
+
+    return template
@@ -0,0 +1,73 @@
+from util.cache import TTLCache
+import copy
+import threading
+
+
+class Call(object):
+    """In-flight computation which concurrent callers with the same key wait for"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        # copy of the result which is never handed out itself, followers and the memo get their own copies of it
+        self.shared = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls with the same key into one and memoize the result for a short time"""
+
+    def __init__(self, memo_size, memo_ttl):
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.memo = TTLCache(maxsize=memo_size, ttl=memo_ttl)
+        self.coalesced = 0
+
+    def do(self, key, fn, timeout=None, retry=None):
+        """Returns the result of fn and whether it was shared with or taken from another call
+
+        Callers may change the returned result, every caller gets its own copy. A follower waits at most timeout seconds
+        for the leader and calls fn itself instead of raising the error of the leader when retry(error) is true.
+        """
+
+        memoized = self.memo.get(key)
+        if memoized is not None:
+            return copy.deepcopy(memoized), True
+
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = Call()
+                self.calls[key] = call
+            else:
+                call.followers += 1
+                self.coalesced += 1
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError("no result for the coalesced call within {:.3f} s".format(timeout))
+            if call.error is not None:
+                if retry is not None and retry(call.error):
+                    return fn(), False
+                raise call.error
+            return copy.deepcopy(call.shared), True
+
+        try:
+            call.result = fn()
+            call.shared = copy.deepcopy(call.result)
+            self.memo.set(key, call.shared)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+        return call.result, False
+
+    def stats(self):
+        return {'in_flight': len(self.calls), 'coalesced': self.coalesced, 'memo': self.memo.stats()}
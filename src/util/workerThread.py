@@ -0,0 +1,28 @@
+import threading
+try:
+    from uwsgidecorators import postfork
+except ImportError:
+    postfork = None
+
+
+# background threads of this worker by name
+threads = {}
+lock = threading.Lock()
+
+
+def start_in_every_worker(name, target, args=()):
+    """Run target in a daemon thread of every worker, threads started before uwsgi forks do not survive in the workers"""
+
+    if postfork is not None:
+        postfork(lambda: start(name, target, args))
+    else:
+        start(name, target, args)
+
+
+def start(name, target, args=()):
+    with lock:
+        if name not in threads:
+            threads[name] = threading.Thread(target=target, args=args, name=name, daemon=True)
+            threads[name].start()
+
+        return threads[name]